@@ -7,8 +7,15 @@ import plotly.express as px
 import plotly.graph_objects as go
 import json
 import os
+import uuid
 from User_Data import UserDataManager
-import time
+from Response_Cache import ResponseCache
+from Gemini_Gateway import GeminiGateway, is_rate_limit_error
+from Ingredients import IngredientCatalog
+from Nutrition import NUTRIENTS, NutrientTable
+from Leftover_Store import LeftoverStore
+from Blob_Store import BlobStore
+from Activity_Log import ActivityLog
 import asyncio
 from concurrent.futures import TimeoutError
 from urllib.parse import quote
@@ -103,15 +110,18 @@ if not GEMINI_API_KEY:
 else:
     genai.configure(api_key=GEMINI_API_KEY)
 
+MODEL_NAME = "gemini-2.5-flash"
+GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 5000,
+}
+
 try:
     model = genai.GenerativeModel(
-        model_name="gemini-2.5-flash",
-        generation_config={
-            "temperature": 0.9,
-            "top_p": 1,
-            "top_k": 1,
-            "max_output_tokens": 5000,
-        },
+        model_name=MODEL_NAME,
+        generation_config=GENERATION_CONFIG,
         safety_settings=[
             {"category": "HARM_CATEGORY_DANGEROUS", "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
         ]
@@ -327,14 +337,32 @@ COOKING_QUIZ = [
 
 # Initialize session state
 
-if "last_gemini_call" not in st.session_state:
-    st.session_state.last_gemini_call = 0
-
 if 'generated_recipe' not in st.session_state:
     st.session_state.generated_recipe = None
 
-if 'user_manager' not in st.session_state:
-    st.session_state.user_manager = UserDataManager()
+if 'generation_jobs' not in st.session_state:
+    st.session_state.generation_jobs = {}
+
+# Leftovers the last generated leftover recipe used, until marked as used
+if 'used_leftovers' not in st.session_state:
+    st.session_state.used_leftovers = []
+
+@st.cache_resource
+def get_user_manager():
+    """One UserDataManager shared by every session instead of a copy per tab"""
+    return UserDataManager()
+
+st.session_state.user_manager = get_user_manager()
+
+# Every user-data write made during this script run is flushed once at the end
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+st.session_state.user_manager.begin(st.session_state.session_id)
+
+def rerun():
+    """Flush this run's user-data writes, then rerun the script"""
+    st.session_state.user_manager.commit()
+    st.rerun()
 
 
 if 'recipe_database' not in st.session_state:
@@ -356,6 +384,31 @@ if 'inventory' not in st.session_state:
         "fruits": ["apples", "bananas", "berries", "mango", "avocado", "lemon"]
     }
 
+# Extra ingredients offered on the Beverage and Dessert generators
+BEVERAGE_INGREDIENTS = [
+    "Mint", "Lemon", "Lime", "Orange", "Apple", "Mango", "Strawberry",
+    "Honey", "Sugar Syrup", "Ginger", "Cinnamon", "Ice", "Chocolate Syrup",
+    "Vanilla Extract", "Coconut Milk", "Almond Milk", "Soda Water", "Tonic Water",
+    "Grenadine", "Pineapple Juice", "Cranberry Juice", "Peach Nectar",
+    "Pomegranate Juice", "Kiwi", "Papaya", "Passion Fruit", "Blueberry",
+    "Raspberry", "Blackberry", "Watermelon", "Cucumber", "Carrot", "Celery",
+    "Beetroot", "Spinach", "Kale", "Avocado", "Peanut Butter", "Chocolate",
+    "Coffee Beans", "Tea Leaves", "Herbal Tea", "Chai Spices", "Matcha",
+    "Lavender", "Rose Water", "Cardamom", "Nutella", "Vanilla Bean", "Cocoa Powder",
+    "Whipped Cream", "Maraschino Cherry", "Sprinkles", "Chocolate Chips",
+    "Gummy Bears", "Fruit Garnish", "Mint Leaves", "Basil", "Thyme",
+    "Rosemary", "Sage", "Parsley", "Chili Powder", "Cayenne Pepper"
+]
+
+DESSERT_INGREDIENTS = [
+    "Sugar", "Flour", "Butter", "Eggs", "Milk", "Cream", "Chocolate",
+    "Vanilla Extract", "Baking Powder", "Cocoa Powder", "Nuts",
+    "Fresh Fruits", "Honey", "Yogurt", "Cream Cheese", "Dark Chocolate",
+    "White Chocolate", "Condensed Milk", "Whipping Cream", "Maple Syrup",
+    "Cinnamon", "Nutmeg", "Caramel", "Berries", "Lemon Zest",
+    "Orange Zest", "Almond Flour", "Coconut", "Peanut Butter"
+]
+
 if 'leftovers' not in st.session_state:
     st.session_state.leftovers = ["spinach", "quinoa", "tomatoes"]
 
@@ -394,7 +447,7 @@ def check_login_required():
                     st.session_state.current_user = username
                     st.session_state.users = st.session_state.user_manager.users
                     st.success(message)
-                    st.rerun()
+                    rerun()
                 else:
                     st.error(message)
         
@@ -407,9 +460,10 @@ def check_login_required():
                     st.session_state.current_user = new_username
                     st.session_state.users = st.session_state.user_manager.users
                     st.success(message)
-                    st.rerun()
+                    rerun()
                 else:
                     st.error(message)
+        st.session_state.user_manager.commit()
         st.stop()
 
 
@@ -420,118 +474,226 @@ if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 
 # Helper Functions
-def generate_recipe_with_timeout(prompt, timeout=60):
-    try:
-        with st.spinner("⏳ Generating your recipe..."):
-            progress_bar = st.progress(0)
-            progress_text = st.empty()
+@st.cache_resource
+def get_recipe_cache():
+    """On-disk cache of Gemini responses shared by every session"""
+    return ResponseCache("recipe_cache.db")
+
+@st.cache_resource
+def get_blob_store():
+    """Content-addressed store of recipe texts; user records keep only the hash"""
+    return BlobStore("recipe_blobs.db")
+
+def store_recipe_text(text):
+    """Reference to `text` in the blob store, for saving in a user record"""
+    return get_blob_store().put(text)
+
+def recipe_text(value):
+    """Recipe text of a saved field, read from the blob store if it holds a reference"""
+    return get_blob_store().resolve(value)
+
+@st.cache_resource
+def get_nutrient_table():
+    """Local per-100 g nutrient table shared by every session"""
+    return NutrientTable("nutrients")
+
+@st.cache_resource
+def get_gemini_gateway():
+    """Process-wide, rate limited worker pool that runs every Gemini call with a real deadline"""
+    return GeminiGateway(
+        max_workers=8,
+        requests_per_minute=int(os.environ.get("PLATEPALS_GEMINI_RPM", 10))
+    )
 
-            # Simulated progress (UI only, no extra API calls)
-            for progress in range(0, 90, 5):
-                progress_bar.progress(progress)
-                progress_text.text(f"Processing... {progress}%")
-                time.sleep(0.2)
+def get_session_id():
+    """Stable id for this browser session, used to queue its generations fairly"""
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
 
-            # SINGLE Gemini API call (THIS IS THE FIX)
-            recipe = model.generate_content(prompt).text
+def _stream_gemini(prompt, timeout):
+    """Yield Gemini text chunks as they are generated, giving up on the connection after `timeout` seconds"""
+    for chunk in model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+        try:
+            yield chunk.text
+        except ValueError:
+            continue  # chunk without text, e.g. only safety ratings
 
-            progress_bar.progress(100)
-            progress_text.text("Recipe generated successfully!")
+def start_generation(prompt, timeout=60):
+    """Start a Gemini generation in the background, served from the recipe cache when possible.
 
-            return recipe
+    Identical prompts already being generated for another session are joined
+    rather than sent upstream again.
+    """
+    cache = get_recipe_cache()
+    key = cache.make_key(MODEL_NAME, GENERATION_CONFIG, prompt=prompt)
+    text = cache.get(key)
+    if text:  # entries cached empty before blocked responses were detected count as misses
+        return get_gemini_gateway().completed(prompt, text)
+    return get_gemini_gateway().submit(
+        _stream_gemini, prompt, timeout, on_success=lambda text: cache.set(key, text),
+        session=get_session_id(), key=key
+    )
 
-    except Exception as e:
-        # Cleanup UI
-        try:
-            progress_bar.empty()
-            progress_text.empty()
-        except:
-            pass
-
-        # Handle quota errors explicitly
-        if "429" in str(e) or "ResourceExhausted" in str(e):
-            st.error(" API limit reached. Please wait a few seconds and try again.")
-        elif "Timeout" in str(e):
-            st.error(" Recipe generation timed out. Please try again.")
-        else:
-            st.error(f"Error generating recipe: {str(e)}")
+def show_generation_error(result):
+    """Explain a failed GenerationResult to the user"""
+    if result.status == "timeout":
+        st.error(" Recipe generation timed out. Please try again.")
+    elif result.status == "cancelled":
+        st.warning("Recipe generation was cancelled.")
+    elif result.status == "blocked":
+        st.error(" Gemini returned no recipe for this request (it may have been blocked by the safety filters). Try rewording it.")
+    elif is_rate_limit_error(result.error):
+        st.error(" API limit reached even after retrying. Please wait a minute and try again.")
+    else:
+        st.error(f"Error generating recipe: {str(result.error)}")
+
+def submit_generation(slot, prompt, timeout=60, **context):
+    """Start a generation for a page slot, replacing the slot's previous job.
 
+    Only the job id (and any `context` the page needs once the text is ready)
+    is kept in session_state; the job itself lives in the gateway, so it
+    keeps running across reruns until the page renders it.
+    """
+    cancel_generation(slot)
+    job = start_generation(prompt, timeout)
+    st.session_state.generation_jobs[slot] = {'job_id': job.id, 'context': context}
+    return job
+
+def _slot_job(slot):
+    entry = st.session_state.generation_jobs.get(slot)
+    if entry is None:
         return None
+    job = get_gemini_gateway().get(entry['job_id'])
+    if job is None:
+        del st.session_state.generation_jobs[slot]  # expired from the result store
+    return job
+
+def pending_generation(slot):
+    """Context of the slot's job if it is running or not yet rendered, else None"""
+    if _slot_job(slot) is None:
+        return None
+    return st.session_state.generation_jobs[slot]['context']
 
+def cancel_generation(slot):
+    job = _slot_job(slot)
+    if job is not None:
+        job.cancel()
+        del st.session_state.generation_jobs[slot]
 
+def _fill_finished_slots(placeholders, finished=None):
+    """Write the text of each slot in `placeholders` whose job has finished; returns the rest.
 
-def get_recipe_from_gemini(ingredients, dietary_restrictions=None):
-    """Generate recipe using Gemini API"""
-    prompt = f"Create a detailed recipe using these ingredients also give the recipe properly including each and every detail of it also do not skip any mention or part of the recipe: {', '.join(ingredients)}"
-    if dietary_restrictions:
-        prompt += f"\nDietary restrictions: {', '.join(dietary_restrictions)}"
-    
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        st.error(f"Error generating recipe: {str(e)}")
+    `finished`, if given, collects the text (None on failure) of each filled slot.
+    """
+    running = {}
+    for slot, placeholder in placeholders.items():
+        job = _slot_job(slot)
+        if job is None:
+            continue
+        if not job.done():
+            running[slot] = placeholder
+            continue
+        st.session_state.generation_jobs.pop(slot, None)
+        result = job.result()
+        with placeholder.container():
+            if result.status == "ok":
+                st.markdown(result.text)
+            else:
+                show_generation_error(result)
+        if finished is not None:
+            finished[slot] = result.text if result.status == "ok" else None
+    return running
+
+def render_generation_slot(slot, alongside=None, finished=None):
+    """Stream the slot's job into the page and return its text once it is finished.
+
+    A rerun while streaming just re-renders the text generated so far and
+    keeps streaming; the text is returned (and the slot cleared) only once.
+    `alongside` maps other slots to placeholders created earlier on the page;
+    each is filled as soon as its job finishes, without waiting for this
+    stream to end, and its result recorded in `finished` if that is given.
+    """
+    job = _slot_job(slot)
+    if job is None:
         return None
+    if not job.done() and st.button("Cancel", key=f"cancel_generation_{slot}"):
+        job.cancel()
+
+    def chunks():
+        waiting = dict(alongside or {})
+        for chunk in job.iter_chunks():
+            if waiting:
+                waiting = _fill_finished_slots(waiting, finished)
+            yield chunk
+        _fill_finished_slots(waiting, finished)
+
+    st.write_stream(chunks())
+    st.session_state.generation_jobs.pop(slot, None)
+    result = job.result()
+    if result.status == "ok":
+        return result.text
+    show_generation_error(result)
+    return None
+
+def render_generation_slots(placeholders):
+    """Fill the placeholder of every pending slot, each as soon as its job finishes.
+
+    One unfinished slot at a time is streamed while the others are filled in
+    whole as they complete. Returns {slot: text or None} for the slots
+    rendered in this run.
+    """
+    finished = {}
+    waiting = [slot for slot in placeholders if _slot_job(slot) is not None]
+    while waiting:
+        slot = waiting[0]
+        others = {other: placeholders[other] for other in waiting[1:]}
+        with placeholders[slot].container():
+            finished[slot] = render_generation_slot(slot, alongside=others, finished=finished)
+        waiting = [other for other in waiting if other not in finished]
+    return finished
+
+def get_activity_log(user):
+    """Columnar activity log of `user` with daily rollups, rebuilt only when it changed elsewhere"""
+    log = st.session_state.get('activity_log_view')
+    if log is None or not log.tracks(user.get('activity_log')):
+        log = ActivityLog.for_user(user)
+        st.session_state.activity_log_view = log
+    return log
 
 def add_points(points, reason):
     """Add points and log activity for the current user"""
     user = st.session_state.users[st.session_state.current_user]
     user['points'] += points
-    user['activity_log'].append({
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "action": reason,
-        "points": points
-    })
+    get_activity_log(user).append(reason, points)
     st.session_state.user_manager.update_user_data(st.session_state.current_user, user)
-def search_ingredients(search_term: str, ingredients_list: list) -> list:
-    """Enhanced ingredient search with flexible matching and custom additions"""
+def get_leftover_store(user):
+    """Indexed leftovers of `user`, rebuilt only when their list changed elsewhere"""
+    store = st.session_state.get('leftover_store')
+    if store is None or not store.tracks(user['leftover_ingredients']):
+        store = LeftoverStore(user['leftover_ingredients'])
+        st.session_state.leftover_store = store
+    return store
+
+def get_ingredient_catalog():
+    """Per-session ingredient catalog built once from the inventory"""
+    if 'ingredient_catalog' not in st.session_state:
+        st.session_state.ingredient_catalog = IngredientCatalog(st.session_state.inventory)
+    return st.session_state.ingredient_catalog
+
+def search_ingredients(search_term: str, extras=()) -> list:
+    """Indexed ingredient search with fuzzy matching and custom additions"""
+    catalog = get_ingredient_catalog()
     if not search_term:
-        return ingredients_list
+        return catalog.view(extras)
 
-    search_term = search_term.lower()
-    
-    # Add searched term if not in list
-    if search_term not in [i.lower() for i in ingredients_list]:
-        ingredients_list.append(search_term.title())
-    
-    # Search with flexible matching
-    matches = [
-        item for item in ingredients_list 
-        if search_term in item.lower() or 
-        item.lower() in search_term or 
-        any(word in item.lower() for word in search_term.split())
-    ]
-    
-    return matches or [search_term.title()]
-
-def get_all_ingredients():
-    """Get all available ingredients across categories"""
-    all_ingredients = []
-    for category_items in st.session_state.inventory.values():
-        all_ingredients.extend(category_items)
-    return list(set(all_ingredients))
-
-def suggest_recipes(ingredients, dietary_restrictions=None):
-    """Generate recipe suggestions with enhanced prompting"""
-    prompt = f"""Create a detailed recipe using these ingredients: {', '.join(ingredients)}
-    Please include:
-    - Recipe name
-    - Preparation time
-    - Cooking time
-    - Difficulty level
-    - Step by step instructions
-    - Additional ingredients needed (if any)
-    """
-    if dietary_restrictions:
-        prompt += f"\nMust be suitable for: {', '.join(dietary_restrictions)}"
-    
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        st.error(f"Error generating recipe: {str(e)}")
-        return None
+    matches = catalog.index(extras).search(search_term)
 
+    # Offer the searched term itself, spelled the way the picker preselects it
+    term = search_term.title()
+    matches = [m for m in matches if m.lower() != term.lower()]
+    matches.insert(0, term)
+    return matches
 
 def get_user_mentions():
     with st.expander("📖 Special Mentions", expanded=False):
@@ -671,7 +833,7 @@ def show_sidebar():
     
     if st.sidebar.button("Logout"):
         st.session_state.current_user = None
-        st.rerun()
+        rerun()
 
     return st.sidebar.selectbox(
         "Select Feature", 
@@ -700,12 +862,12 @@ def show_user_profile(user_data):
     
     with tabs[0]:
         st.subheader("📊 Activity History")
-        if user_data['activity_log']:
-            df = pd.DataFrame(user_data['activity_log'])
-            st.dataframe(df, hide_index=True)
+        activity = get_activity_log(user_data)
+        if len(activity):
+            st.dataframe(activity.entries(), hide_index=True)
             
-            # Points Timeline
-            fig = px.line(df, x='date', y='points', title='Points Timeline')
+            # Points Timeline, one point per active day
+            fig = px.line(activity.daily(), x='day', y=['points', 'total'], title='Points Timeline')
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No activity recorded yet")
@@ -723,7 +885,7 @@ def show_user_profile(user_data):
                 st.write("**Ingredients used:**")
                 st.write(", ".join(recipe['ingredients']))
                 st.write("**Recipe details:**")
-                st.write(recipe['details'])
+                st.write(recipe_text(recipe['details']))
       else:
         st.info("No recipes created yet. Try the Recipe Suggestions feature!")
 
@@ -782,7 +944,7 @@ def show_user_profile(user_data):
                 
                 # Full Recipe
                 st.write("**📖 Complete Recipe:**")
-                st.write(recipe['recipe'])
+                st.write(recipe_text(recipe['recipe']))
      else:
         st.info("No leftover recipes created yet. Try the Leftover Management feature!")
 
@@ -870,12 +1032,11 @@ def show_user_profile(user_data):
             )
             
             # Show user's rank
-            user_rank = next((i + 1 for i, x in enumerate(leaderboard) 
-                            if x['username'] == st.session_state.current_user), 0)
+            user_rank = st.session_state.user_manager.get_rank(st.session_state.current_user)
             st.metric("Your Rank", f"#{user_rank}")
              # Top players visualization
             st.subheader("Top Players")
-            top_players = leaderboard[:5]  # Get top 5 players
+            top_players = st.session_state.user_manager.get_leaderboard(limit=5)  # Get top 5 players
             
             fig = go.Figure()
             fig.add_trace(go.Bar(
@@ -919,7 +1080,7 @@ def show_user_profile(user_data):
                 st.write("**Ingredients used:**")
                 st.write(", ".join(recipe['ingredients']))
                 st.write("**Recipe details:**")
-                st.write(recipe['details'])
+                st.write(recipe_text(recipe['details']))
         
         # Add visualization
           st.subheader("Beverage Types Distribution")
@@ -966,7 +1127,7 @@ def show_user_profile(user_data):
                     st.write("**Dietary Restrictions:**")
                     st.write(", ".join(recipe['dietary_restrictions']))
                 st.write("**Recipe details:**")
-                st.write(recipe['details'])
+                st.write(recipe_text(recipe['details']))
         
         # Add visualization
         st.subheader("Dessert Types Distribution")
@@ -1114,72 +1275,95 @@ elif app_mode == "Search":
                    - Cultural significance (if any)
                 """
 
-                recipe_info = generate_recipe_with_timeout(prompt)
-                
-                if recipe_info:
-                    st.success("✨ Recipe found! Here are the details:")
-
-                    with st.expander("📖 View Complete Recipe Details", expanded=True):
-                        st.write(recipe_info)
-                    
-                    # Add YouTube link with more visible styling
-                    st.markdown("---")
-                    st.subheader("🎥 Watch Recipe Videos")
-                    youtube_query = quote(f"{search_query} recipe cooking")
-                    youtube_link = f"https://www.youtube.com/results?search_query={youtube_query}"
-                    st.markdown(
-                        f"""
-                        <div style='text-align: center; padding: 10px; margin: 10px 0; background-color: #f0f2f6; border-radius: 5px;'>
-                            <a href='{youtube_link}' target='_blank' style='color: red; text-decoration: none;'>
-                                <span style='font-size: 20px;'>🎥 Watch {search_query} Recipe Videos on YouTube</span>
-                            </a>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                    st.markdown("---")
-
-
-                    # Save search to user's history
-                    user = st.session_state.users[st.session_state.current_user]
-                    if 'recipe_searches' not in user:
-                        user['recipe_searches'] = []
-                    
-                    # Save search with more details
-                    user['recipe_searches'].append({
-                        'recipe': search_query,
-                        'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                        'details': recipe_info,
-                        'youtube_link': f"https://www.youtube.com/results?search_query={quote(search_query + ' recipe')}",
-                        'search_timestamp': datetime.now().timestamp()
-                    })
-                    
-                    # Update user data
-                    st.session_state.user_manager.update_user_data(
-                        st.session_state.current_user, 
-                        user
-                    )
-                    
-                    # Award points
-                    add_points(5, f"Searched recipe: {search_query}")
-                    st.success("🎉 +5 points awarded for recipe search!")
-
-                    # Show related recipes suggestion
-                    st.subheader("📚 You might also like:")
-                    related_prompt = f"Suggest 3 similar recipes to {search_query} with brief descriptions"
-                    related_recipes = model.generate_content(related_prompt).text
-                    st.write(related_recipes)
+                # Start the related suggestions too so they generate while the
+                # main recipe streams in
+                related_prompt = f"Suggest 3 similar recipes to {search_query} with brief descriptions"
+                submit_generation("search_recipe", prompt, query=search_query)
+                submit_generation("search_related", related_prompt)
 
         else:
             st.warning("Please enter a recipe name to search")
 
+    pending_search = pending_generation("search_recipe")
+    if pending_search is not None:
+        query = pending_search['query']
+        # Lay out the page first so the related suggestions can be filled in
+        # as soon as they are ready, while the main recipe is still streaming
+        details = st.expander("📖 View Complete Recipe Details", expanded=True)
+        outcome = st.container()
+        related_area = st.empty()
+        related = {}
+        if pending_generation("search_related") is not None:
+            with related_area.container():
+                st.subheader("📚 You might also like:")
+                related["search_related"] = st.empty()
+        with details:
+            recipe_info = render_generation_slot("search_recipe", alongside=related)
+
+        if not recipe_info:
+            cancel_generation("search_related")
+            related_area.empty()
+        else:
+            with outcome:
+                st.success("✨ Recipe found! Here are the details:")
+
+                # Add YouTube link with more visible styling
+                st.markdown("---")
+                st.subheader("🎥 Watch Recipe Videos")
+                youtube_query = quote(f"{query} recipe cooking")
+                youtube_link = f"https://www.youtube.com/results?search_query={youtube_query}"
+                st.markdown(
+                    f"""
+                    <div style='text-align: center; padding: 10px; margin: 10px 0; background-color: #f0f2f6; border-radius: 5px;'>
+                        <a href='{youtube_link}' target='_blank' style='color: red; text-decoration: none;'>
+                            <span style='font-size: 20px;'>🎥 Watch {query} Recipe Videos on YouTube</span>
+                        </a>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+                st.markdown("---")
+
+
+                # Save search to user's history
+                user = st.session_state.users[st.session_state.current_user]
+                if 'recipe_searches' not in user:
+                    user['recipe_searches'] = []
+
+                # Save search with more details
+                user['recipe_searches'].append({
+                    'recipe': query,
+                    'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
+                    'details': store_recipe_text(recipe_info),
+                    'youtube_link': f"https://www.youtube.com/results?search_query={quote(query + ' recipe')}",
+                    'search_timestamp': datetime.now().timestamp()
+                })
+
+                # Update user data
+                st.session_state.user_manager.update_user_data(
+                    st.session_state.current_user, 
+                    user
+                )
+
+                # Award points
+                add_points(5, f"Searched recipe: {query}")
+                st.success("🎉 +5 points awarded for recipe search!")
+
+            if pending_generation("search_related") is not None:
+                with related["search_related"].container():
+                    render_generation_slot("search_related")
+
+    elif pending_generation("search_related") is not None:
+        st.subheader("📚 You might also like:")
+        render_generation_slot("search_related")
+
     # Show recent searches
     st.subheader("📅 Recent Searches")
     user = st.session_state.users[st.session_state.current_user]
     if 'recipe_searches' in user and user['recipe_searches']:
         for search in reversed(user['recipe_searches'][-5:]):  # Show last 5 searches
             with st.expander(f"{search['date']} - {search['recipe']}"):
-                st.write(search['details'])
+                st.write(recipe_text(search['details']))
     else:
         st.info("No recent searches yet")
 
@@ -1238,19 +1422,16 @@ elif app_mode == "Recipe Suggestions":
         show_categories = st.checkbox("Show categories", value=False)
     
     # Get and filter ingredients 
-    all_ingredients = get_all_ingredients()
-    if search_term:
-        filtered_ingredients = search_ingredients(search_term, all_ingredients)
-    else:
-        filtered_ingredients = all_ingredients
+    filtered_ingredients = search_ingredients(search_term)
     
     if show_categories:
-        category = st.selectbox("Filter by category", list(st.session_state.inventory.keys()))
-        filtered_ingredients = [i for i in filtered_ingredients if i in st.session_state.inventory[category]]
+        catalog = get_ingredient_catalog()
+        category = st.selectbox("Filter by category", catalog.categories())
+        filtered_ingredients = [i for i in filtered_ingredients if catalog.has(category, i)]
     
     selected_ingredients = st.multiselect(
         "Selected Ingredients",
-        options=sorted(filtered_ingredients),
+        options=filtered_ingredients,
         default=[search_term.title()] if search_term else [],
         key="recipe_ingredients"
     )
@@ -1292,29 +1473,45 @@ elif app_mode == "Recipe Suggestions":
                 - Tips for portion control
                 """
                 
-                recipe = model.generate_content(prompt).text
-                if recipe:
-                    st.session_state.generated_recipe = recipe
-                    st.success("Recipe generated successfully!")
-                    
-                    # Save enhanced recipe data to user's profile
-                    user = st.session_state.users[st.session_state.current_user]
-                    user['created_recipes'].append({
-                        'name': f"Recipe with {', '.join(selected_ingredients)}",
-                        'details': recipe,
-                        'date': date.strftime("%Y-%m-%d"),
-                        'time_of_day': time_of_day,
-                        'user_mood': user_mood,
-                        'hunger_level': hunger_level,
-                        'calorie_limit': calorie_limit,
-                        'ingredients': selected_ingredients,
-                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M")
-                    })
-                    
-                    add_points(5, "Generated personalized recipe")
-                    check_achievements(user, "recipe")
+                submit_generation(
+                    "suggested_recipe", prompt,
+                    date=date.strftime("%Y-%m-%d"),
+                    time_of_day=time_of_day,
+                    user_mood=user_mood,
+                    hunger_level=hunger_level,
+                    calorie_limit=calorie_limit,
+                    ingredients=selected_ingredients
+                )
         else:
             st.warning("Please select ingredients first")
+
+    suggestion_request = pending_generation("suggested_recipe")
+    if suggestion_request is not None:
+        # Stream the recipe in, then hand over to the full recipe view below
+        stream_placeholder = st.empty()
+        with stream_placeholder.container():
+            recipe = render_generation_slot("suggested_recipe")
+        if recipe:
+            stream_placeholder.empty()
+            st.session_state.generated_recipe = recipe
+            st.success("Recipe generated successfully!")
+            
+            # Save enhanced recipe data to user's profile
+            user = st.session_state.users[st.session_state.current_user]
+            user['created_recipes'].append({
+                'name': f"Recipe with {', '.join(suggestion_request['ingredients'])}",
+                'details': store_recipe_text(recipe),
+                'date': suggestion_request['date'],
+                'time_of_day': suggestion_request['time_of_day'],
+                'user_mood': suggestion_request['user_mood'],
+                'hunger_level': suggestion_request['hunger_level'],
+                'calorie_limit': suggestion_request['calorie_limit'],
+                'ingredients': suggestion_request['ingredients'],
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M")
+            })
+            
+            add_points(5, "Generated personalized recipe")
+            check_achievements(user, "recipe")
             
     if st.session_state.generated_recipe:
         with st.expander("📖 View Full Recipe", expanded=True):
@@ -1365,7 +1562,7 @@ elif app_mode == "Leftover Management":
     if st.button("Add Ingredient", type="primary"):
         if ingredient_name:
             user = st.session_state.users[st.session_state.current_user]
-            user['leftover_ingredients'].append({
+            get_leftover_store(user).add({
                 'name': ingredient_name,
                 'type': ingredient_type,
                 'quantity': quantity,
@@ -1377,7 +1574,7 @@ elif app_mode == "Leftover Management":
             st.success(f"Added {quantity}g of {ingredient_name}")
             add_points(2, f"Added leftover: {ingredient_name}")
             check_achievements(user, "leftover")
-            st.rerun()
+            rerun()
     
     # Display current leftovers with filtering
     st.subheader("Current Leftovers")
@@ -1397,18 +1594,18 @@ elif app_mode == "Leftover Management":
                 options=["Refrigerated", "Frozen", "Room Temperature", "Pantry"]
             )
         
-        # Filter the leftovers
-        leftovers_df = pd.DataFrame(user['leftover_ingredients'])
-        if type_filter:
-            leftovers_df = leftovers_df[leftovers_df['type'].isin(type_filter)]
-        if storage_filter:
-            leftovers_df = leftovers_df[leftovers_df['storage'].isin(storage_filter)]
-        
-        st.dataframe(
-            leftovers_df[['name', 'type', 'quantity', 'storage', 'freshness', 'expiry_date', 'date_added']], 
-            hide_index=True
+        # Filter the leftovers, soonest to expire first
+        store = get_leftover_store(user)
+        if type_filter or storage_filter:
+            shown = sorted(store.filter(type_filter, storage_filter), key=lambda item: item.get('expiry_date') or "")
+        else:
+            shown = store.by_expiry()
+        leftovers_df = pd.DataFrame(
+            shown, columns=['name', 'type', 'quantity', 'storage', 'freshness', 'expiry_date', 'date_added']
         )
         
+        st.dataframe(leftovers_df, hide_index=True)
+        
         # Enhanced Recipe Generation
         st.subheader("Generate Recipe from Leftovers")
         
@@ -1429,6 +1626,7 @@ elif app_mode == "Leftover Management":
                 value=400,
                 step=50
             )
+            servings = st.number_input("Servings", min_value=1, max_value=50, value=2)
         
         with col2:
             meal_type = st.selectbox(
@@ -1443,7 +1641,7 @@ elif app_mode == "Leftover Management":
         # Ingredient selection
         selected = st.multiselect(
             "Select ingredients for recipe",
-            options=[item['name'] for item in user['leftover_ingredients']]
+            options=store.names()
         )
         
         dietary_prefs = st.multiselect(
@@ -1453,12 +1651,42 @@ elif app_mode == "Leftover Management":
         
         mentions = get_user_mentions()
 
+        # Estimate the recipe's nutrition locally so an impossible calorie
+        # target shows up before asking Gemini
+        if selected:
+            per_serving, missing = get_nutrient_table().totals(
+                selected, [store.get(name)['quantity'] for name in selected], servings
+            )
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Calories / serving", f"{per_serving['calories']:.0f} kcal")
+            col2.metric("Protein / serving", f"{per_serving['protein_g']:.1f} g")
+            col3.metric("Carbs / serving", f"{per_serving['carbohydrates_total_g']:.1f} g")
+            col4.metric("Fat / serving", f"{per_serving['fat_total_g']:.1f} g")
+            if missing:
+                st.caption("Estimate is partial, no data for: " + "; ".join(
+                    f"{name} ({'all nutrients' if len(gaps) == len(NUTRIENTS) else ', '.join(gaps)})"
+                    for name, gaps in missing.items()
+                ))
+            # With calories missing for some ingredients the total is only a lower bound
+            no_calories = [name for name, gaps in missing.items() if 'calories' in gaps]
+            if per_serving['calories'] > calorie_target:
+                needed = int(-(-per_serving['calories'] * servings // calorie_target))
+                st.warning(
+                    f"These ingredients come to {'at least' if no_calories else 'about'} "
+                    f"{per_serving['calories']:.0f} kcal per serving, "
+                    f"above your {calorie_target} kcal target. Try {needed} servings or fewer ingredients."
+                )
+            elif no_calories:
+                st.warning(
+                    f"Calories for {', '.join(no_calories)} are unknown, so the {per_serving['calories']:.0f} kcal "
+                    f"per serving above may be too low to check against your {calorie_target} kcal target."
+                )
+
     if st.button("Generate Recipe", type="primary") and selected:
         # First create the ingredients list
         ingredients_with_details = []
         for ingredient in selected:
-            item = next(item for item in user['leftover_ingredients'] 
-                       if item['name'] == ingredient)
+            item = get_leftover_store(user).get(ingredient)
             ingredients_with_details.append({
                 'name': ingredient,
                 'quantity': item['quantity'],
@@ -1473,6 +1701,7 @@ elif app_mode == "Leftover Management":
         - Meal Type: {meal_type}
         - Maximum Cooking Time: {cooking_time} minutes
         - Target Calories: {calorie_target} calories per serving
+        - Servings: {servings}
         - Difficulty Level: {difficulty_level}
         {f"- Dietary Restrictions: {', '.join(dietary_prefs)}" if dietary_prefs else ""}
         
@@ -1491,46 +1720,52 @@ elif app_mode == "Leftover Management":
         6. Storage suggestions for leftovers
         """
         
-        import time
+        submit_generation(
+            "leftover_recipe", prompt,
+            ingredients=ingredients_with_details,
+            meal_type=meal_type,
+            cooking_time=cooking_time,
+            calories=calorie_target,
+            servings=servings,
+            difficulty=difficulty_level,
+            dietary_prefs=dietary_prefs
+        )
+    else:
+        st.info("No leftovers added yet")
 
-        COOLDOWN_SECONDS = 30
-        current_time = time.time()
-
-        if current_time - st.session_state.last_gemini_call < COOLDOWN_SECONDS:
-            wait_time = int(COOLDOWN_SECONDS - (current_time - st.session_state.last_gemini_call))
-            st.warning(f" Please wait {wait_time} seconds before generating another recipe.")
-        else:
-            recipe = generate_recipe_with_timeout(prompt)
-            st.session_state.last_gemini_call = current_time
+    leftover_request = pending_generation("leftover_recipe")
+    if leftover_request is not None:
+        with st.expander("📖 View Generated Recipe", expanded=True):
+            recipe = render_generation_slot("leftover_recipe")
 
         if recipe:
-            with st.expander("📖 View Generated Recipe", expanded=True):
-                st.success(" Recipe generated successfully!")
-                st.write(recipe)
-                
-                # Save the recipe with enhanced details
-                user['leftovers'].append({
-                    'name': f"Leftover Recipe ({datetime.now().strftime('%Y-%m-%d %H:%M')})",
-                    'ingredients': ingredients_with_details,
-                    'meal_type': meal_type,
-                    'cooking_time': cooking_time,
-                    'calories': calorie_target,
-                    'difficulty': difficulty_level,
-                    'dietary_prefs': dietary_prefs,
-                    'recipe': recipe,
-                    'date': datetime.now().strftime("%Y-%m-%d %H:%M")
-                })
-                add_points(5, "Generated leftover recipe")
-            # Option to remove used ingredients
-            if st.button(" Mark Ingredients as Used"):
-                user['leftover_ingredients'] = [
-                    item for item in user['leftover_ingredients']
-                    if item['name'] not in selected
-                ]
-                st.success("Ingredients marked as used")
-                st.rerun()
-    else:
-        st.info("No leftovers added yet")
+            st.success(" Recipe generated successfully!")
+
+            # Save the recipe with enhanced details
+            user['leftovers'].append({
+                'name': f"Leftover Recipe ({datetime.now().strftime('%Y-%m-%d %H:%M')})",
+                'ingredients': leftover_request['ingredients'],
+                'meal_type': leftover_request['meal_type'],
+                'cooking_time': leftover_request['cooking_time'],
+                'calories': leftover_request['calories'],
+                'servings': leftover_request['servings'],
+                'difficulty': leftover_request['difficulty'],
+                'dietary_prefs': leftover_request['dietary_prefs'],
+                'recipe': store_recipe_text(recipe),
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M")
+            })
+            add_points(5, "Generated leftover recipe")
+            st.session_state.used_leftovers = [item['name'] for item in leftover_request['ingredients']]
+
+    # Option to remove used ingredients; shown until clicked, since the
+    # click reruns the page after the recipe's slot has been cleared
+    if st.session_state.used_leftovers:
+        if st.button(" Mark Ingredients as Used"):
+            get_leftover_store(user).remove_many(st.session_state.used_leftovers)
+            st.session_state.user_manager.update_user_data(st.session_state.current_user, user)
+            st.session_state.used_leftovers = []
+            st.success("Ingredients marked as used")
+            rerun()
 
 elif app_mode == "Menu Personalization":
     st.title("🍽️ Complete Meal Planner")
@@ -1679,30 +1914,38 @@ elif app_mode == "Menu Personalization":
             - Any special tips or variations
             """
 
-            menu = generate_recipe_with_timeout(prompt)
-            if menu:
-                st.success("Complete menu generated successfully!")
-                
-                # Display the menu in an organized way
-                with st.expander("📋 View Complete Menu", expanded=True):
-                    st.write(menu)
-                    
-                    # Save to user's profile
-                    user = st.session_state.users[st.session_state.current_user]
-                    user['created_recipes'].append({
-                        'name': f"{cuisine_type} {meal_occasion} Menu",
-                        'type': 'complete_menu',
-                        'cuisine': cuisine_type,
-                        'occasion': meal_occasion,
-                        'servings': serving_size,
-                        'details': menu,
-                        'dietary_restrictions': dietary_prefs,
-                        'date': datetime.now().strftime("%Y-%m-%d %H:%M")
-                    })
-                    
-                    # Add points and check achievements
-                    add_points(15, "Generated complete menu")
-                    check_achievements(user, "recipe")
+            submit_generation(
+                "complete_menu", prompt,
+                cuisine=cuisine_type,
+                occasion=meal_occasion,
+                servings=serving_size,
+                dietary_restrictions=dietary_prefs
+            )
+
+    menu_request = pending_generation("complete_menu")
+    if menu_request is not None:
+        # Display the menu in an organized way as it streams in
+        with st.expander("📋 View Complete Menu", expanded=True):
+            menu = render_generation_slot("complete_menu")
+        if menu:
+            st.success("Complete menu generated successfully!")
+        
+            # Save to user's profile
+            user = st.session_state.users[st.session_state.current_user]
+            user['created_recipes'].append({
+                'name': f"{menu_request['cuisine']} {menu_request['occasion']} Menu",
+                'type': 'complete_menu',
+                'cuisine': menu_request['cuisine'],
+                'occasion': menu_request['occasion'],
+                'servings': menu_request['servings'],
+                'details': store_recipe_text(menu),
+                'dietary_restrictions': menu_request['dietary_restrictions'],
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M")
+            })
+        
+            # Add points and check achievements
+            add_points(15, "Generated complete menu")
+            check_achievements(user, "recipe")
 
 elif app_mode == "Event Manager":
     st.title("🎉 Event Manager")
@@ -1734,7 +1977,22 @@ elif app_mode == "Event Manager":
         st.subheader("Menu Planning")
         courses = ["Appetizers", "Main Course", "Desserts", "Beverages"]
         menu_items = {}
+
+        def course_prompt(course):
+            return f"""Suggest 3 {course.lower()} for a {event_theme} themed event with {guest_count} guests.
+                        Must accommodate these dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
+                        Include brief descriptions."""
+
+        if st.button("✨ Suggest Whole Menu"):
+            # Every course generates at the same time and is shown in its own
+            # row as soon as it is ready, so the whole menu costs a single
+            # round-trip of latency
+            for course in courses:
+                submit_generation(f"event_course_{course}", course_prompt(course))
         
+        # Suggestion rows are laid out here and filled once the whole page is
+        # drawn (see the end of this page)
+        course_rows = {}
         for course in courses:
             st.write(f"**{course}**")
             col1, col2 = st.columns(2)
@@ -1742,15 +2000,8 @@ elif app_mode == "Event Manager":
             with col1:
                 # Get suggestions based on theme and restrictions
                 if st.button(f"Get {course} Suggestions"):
-                    with st.spinner("Generating suggestions..."):
-                        prompt = f"""Suggest 3 {course.lower()} for a {event_theme} themed event with {guest_count} guests.
-                        Must accommodate these dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-                        Include brief descriptions."""
-                        
-                        suggestions = get_recipe_from_gemini([], dietary_restrictions)
-                        if suggestions:
-                            st.write(suggestions)
-                            add_points(2, f"Generated {course.lower()} suggestions")
+                    submit_generation(f"event_course_{course}", course_prompt(course))
+                course_rows[f"event_course_{course}"] = st.empty()
             
             with col2:
                 menu_items[course] = st.text_area(f"Selected {course}", height=100,
@@ -1825,11 +2076,11 @@ elif app_mode == "Event Manager":
                     with col1:
                         if st.button(f"Mark Complete {idx}"):
                             st.session_state.events[idx]['status'] = "Completed"
-                            st.rerun()
+                            rerun()
                     with col2:
                         if st.button(f"Delete Event {idx}"):
                             st.session_state.events.pop(idx)
-                            st.rerun()
+                            rerun()
     
     with tab3:
         st.subheader("Event Analytics")
@@ -1857,6 +2108,12 @@ elif app_mode == "Event Manager":
                     st.metric("Average Event Cost", 
                              f"{events_df['total_cost'].mean():,.2f}")
 
+    # Fill the course rows of the Create Event tab as their suggestions finish
+    for slot, suggestions in render_generation_slots(course_rows).items():
+        if suggestions:
+            course = slot[len("event_course_"):]
+            add_points(2, f"Generated {course.lower()} suggestions")
+
 elif app_mode == "Cooking Quiz":
     st.title("👩‍🍳 Cooking Knowledge Quiz")
     st.write("Test your cooking knowledge and earn points!")
@@ -1913,7 +2170,7 @@ elif app_mode == "Cooking Quiz":
         
         # Show continue button
         if st.button("Next Question"):
-            st.rerun()
+            rerun()
 
 
 elif app_mode == "Beverage Generator":
@@ -1932,29 +2189,11 @@ elif app_mode == "Beverage Generator":
             help="Type any ingredient - it will be added if not found")
         
         # Get and filter ingredients
-        all_ingredients = get_all_ingredients() + [
-            "Mint", "Lemon", "Lime", "Orange", "Apple", "Mango", "Strawberry",
-            "Honey", "Sugar Syrup", "Ginger", "Cinnamon", "Ice", "Chocolate Syrup",
-            "Vanilla Extract", "Coconut Milk", "Almond Milk", "Soda Water", "Tonic Water",
-            "Grenadine", "Pineapple Juice", "Cranberry Juice", "Peach Nectar",
-            "Pomegranate Juice", "Kiwi", "Papaya", "Passion Fruit", "Blueberry",
-            "Raspberry", "Blackberry", "Watermelon", "Cucumber", "Carrot", "Celery",
-            "Beetroot", "Spinach", "Kale", "Avocado", "Peanut Butter", "Chocolate" ,
-            "Coffee Beans", "Tea Leaves", "Herbal Tea", "Chai Spices", "Matcha",
-            "Lavender", "Rose Water", "Cardamom", "Nutella", "Vanilla Bean", "Cocoa Powder",
-            "Whipped Cream", "Maraschino Cherry", "Sprinkles", "Chocolate Chips",
-            "Gummy Bears", "Fruit Garnish", "Mint Leaves", "Basil", "Thyme",
-            "Rosemary", "Sage", "Parsley", "Chili Powder", "Cayenne Pepper"
-        ]
-        
-        if ingredient_search:
-            filtered_ingredients = search_ingredients(ingredient_search, all_ingredients)
-        else:
-            filtered_ingredients = all_ingredients
+        filtered_ingredients = search_ingredients(ingredient_search, BEVERAGE_INGREDIENTS)
         
         selected_ingredients = st.multiselect(
             "Selected Ingredients",
-            options=sorted(filtered_ingredients),
+            options=filtered_ingredients,
             default=[ingredient_search.title()] if ingredient_search else [],
             key="beverage_ingredients"
         )
@@ -2008,31 +2247,36 @@ elif app_mode == "Beverage Generator":
                 - Tips for best results
                 """
                 
-                recipe = model.generate_content(prompt).text
-                if recipe:
-                    st.success("Recipe generated successfully!")
-                    st.write(recipe)
-                    
-                    # Save to user's data
-                    user = st.session_state.users[st.session_state.current_user]
-                    current_user = st.session_state.current_user
-                    user['created_recipes'].append({
-                    'name': f"{beverage_type} Recipe",
-                    'type': 'beverage',
-                    'ingredients': all_ingredients,
-                    'details': recipe,
-                    'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                    'dietary_restrictions': dietary_restrictions,  # Add this
-                    'season': seasonal  # Add this
-               })
-                add_points(5, "Generated beverage recipe")
-            # Add this line:
-            current_user = st.session_state.current_user
-            user = st.session_state.users[current_user]
-            check_achievements(user, "beverage")
+                submit_generation(
+                    "beverage_recipe", prompt,
+                    beverage_type=beverage_type,
+                    ingredients=all_ingredients,
+                    dietary_restrictions=dietary_restrictions,
+                    season=seasonal
+                )
         else:
             st.warning("Please select a beverage type and at least one ingredient")
 
+    beverage_request = pending_generation("beverage_recipe")
+    if beverage_request is not None:
+        recipe = render_generation_slot("beverage_recipe")
+        if recipe:
+            st.success("Recipe generated successfully!")
+            
+            # Save to user's data
+            user = st.session_state.users[st.session_state.current_user]
+            user['created_recipes'].append({
+                'name': f"{beverage_request['beverage_type']} Recipe",
+                'type': 'beverage',
+                'ingredients': beverage_request['ingredients'],
+                'details': store_recipe_text(recipe),
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
+                'dietary_restrictions': beverage_request['dietary_restrictions'],
+                'season': beverage_request['season']
+            })
+            add_points(5, "Generated beverage recipe")
+            check_achievements(user, "beverage")
+
 
 elif app_mode == "Dessert Generator":
     st.title("🍰 Dessert Generator")
@@ -2052,23 +2296,11 @@ elif app_mode == "Dessert Generator":
             help="Type any ingredient - it will be added if not found")
         
         # Base ingredients for desserts
-        all_ingredients = get_all_ingredients() + [
-            "Sugar", "Flour", "Butter", "Eggs", "Milk", "Cream", "Chocolate",
-            "Vanilla Extract", "Baking Powder", "Cocoa Powder", "Nuts",
-            "Fresh Fruits", "Honey", "Yogurt", "Cream Cheese", "Dark Chocolate",
-            "White Chocolate", "Condensed Milk", "Whipping Cream", "Maple Syrup",
-            "Cinnamon", "Nutmeg", "Caramel", "Berries", "Lemon Zest",
-            "Orange Zest", "Almond Flour", "Coconut", "Peanut Butter"
-        ]
-        
-        if ingredient_search:
-            filtered_ingredients = search_ingredients(ingredient_search, all_ingredients)
-        else:
-            filtered_ingredients = all_ingredients
+        filtered_ingredients = search_ingredients(ingredient_search, DESSERT_INGREDIENTS)
         
         selected_ingredients = st.multiselect(
             "Selected Ingredients",
-            options=sorted(filtered_ingredients),
+            options=filtered_ingredients,
             default=[ingredient_search.title()] if ingredient_search else [],
             key="dessert_ingredients"
         )
@@ -2121,25 +2353,34 @@ elif app_mode == "Dessert Generator":
                 - Storage instructions
                 """
                 
-                recipe = model.generate_content(prompt).text
-                if recipe:
-                    st.success("Recipe generated successfully!")
-                    st.write(recipe)
-                    
-                    # Save to user's data
-                    user = st.session_state.users[st.session_state.current_user]
-                    user['created_recipes'].append({
-                        'name': f"{cuisine_type} {dessert_type}",
-                        'type': 'dessert',
-                        'cuisine': cuisine_type,
-                        'ingredients': selected_ingredients,
-                        'details': recipe,
-                        'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                        'dietary_restrictions': dietary_restrictions
-                    })
-                    add_points(5, "Generated dessert recipe")
-                    check_achievements(user, "dessert")
+                submit_generation(
+                    "dessert_recipe", prompt,
+                    dessert_type=dessert_type,
+                    cuisine=cuisine_type,
+                    ingredients=selected_ingredients,
+                    dietary_restrictions=dietary_restrictions
+                )
         else:
             st.warning("Please select a dessert type and at least one ingredient")
 
+    dessert_request = pending_generation("dessert_recipe")
+    if dessert_request is not None:
+        recipe = render_generation_slot("dessert_recipe")
+        if recipe:
+            st.success("Recipe generated successfully!")
+            
+            # Save to user's data
+            user = st.session_state.users[st.session_state.current_user]
+            user['created_recipes'].append({
+                'name': f"{dessert_request['cuisine']} {dessert_request['dessert_type']}",
+                'type': 'dessert',
+                'cuisine': dessert_request['cuisine'],
+                'ingredients': dessert_request['ingredients'],
+                'details': store_recipe_text(recipe),
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
+                'dietary_restrictions': dessert_request['dietary_restrictions']
+            })
+            add_points(5, "Generated dessert recipe")
+            check_achievements(user, "dessert")
 
+st.session_state.user_manager.commit()
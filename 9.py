@@ -3,12 +3,21 @@ import pandas as pd
 import random
 from datetime import datetime, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import plotly.express as px
 import plotly.graph_objects as go
 import json
 import os
+import uuid
 from User_Data import UserDataManager
+from Response_Cache import ResponseCache
+from Nutrition import NUTRIENTS, NutrientTable, per_100g
+from Ingredients import IngredientCatalog
+from Blob_Store import BlobStore
+from Activity_Log import ActivityLog
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
 # ========== CONFIGURATION ==========
@@ -26,6 +35,9 @@ if not API_NINJA_KEY:
 RECIPE_API_ENDPOINT = "https://api.api-ninjas.com/v1/recipe"
 NUTRITION_API_ENDPOINT = "https://api.api-ninjas.com/v1/nutrition"
 
+# Nutrition lookups that failed (error status, timeout) are not retried sooner than this
+NUTRITION_RETRY_SECONDS = 600
+
 ACHIEVEMENTS = {
     "recipe_achievements": [
         {"name": "Recipe Rookie", "requirement": 15, "points": 25, "description": "Generate 15 recipes"},
@@ -265,8 +277,22 @@ st.set_page_config(page_title="PlatePals - Smart Restaurant Management", page_ic
 st.markdown("<div style='text-align:center'><h1 style='margin:0'>🍽️ PlatePals</h1><p style='margin:0;color:gray'>Serve Smart. Waste Less. Know More.</p></div>", unsafe_allow_html=True)
 
 # Initialize session state
-if 'user_manager' not in st.session_state:
-    st.session_state.user_manager = UserDataManager()
+@st.cache_resource
+def get_user_manager():
+    """One UserDataManager shared by every session instead of a copy per tab"""
+    return UserDataManager()
+
+st.session_state.user_manager = get_user_manager()
+
+# Every user-data write made during this script run is flushed once at the end
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+st.session_state.user_manager.begin(st.session_state.session_id)
+
+def rerun():
+    """Flush this run's user-data writes, then rerun the script"""
+    st.session_state.user_manager.commit()
+    st.rerun()
 
 if 'inventory' not in st.session_state:
     st.session_state.inventory = {
@@ -277,6 +303,17 @@ if 'inventory' not in st.session_state:
         "dairy": ["milk", "butter", "cheese", "yogurt", "cream"]
     }
 
+# Extra ingredients offered on the Beverage and Dessert generators
+BEVERAGE_INGREDIENTS = [
+    "Mint", "Lemon", "Lime", "Orange", "Mango", "Strawberry", "Honey",
+    "Ginger", "Cinnamon", "Ice", "Milk", "Yogurt", "Coconut Milk"
+]
+
+DESSERT_INGREDIENTS = [
+    "Sugar", "Flour", "Butter", "Eggs", "Milk", "Cream", "Chocolate",
+    "Vanilla", "Cinnamon", "Nuts", "Berries", "Honey", "Caramel"
+]
+
 if 'events' not in st.session_state:
     st.session_state.events = []
 
@@ -287,20 +324,65 @@ if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 
 # ========== API HELPER FUNCTIONS ==========
+@st.cache_resource
+def get_http_session():
+    """Keep-alive HTTP session shared by every session, retrying transient failures"""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                  allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update({"X-Api-Key": API_NINJA_KEY})
+    return session
+
+@st.cache_resource
+def get_api_cache():
+    """On-disk cache of API Ninja responses shared by every session"""
+    return ResponseCache("api_ninja_cache.db", ttl_seconds=24 * 3600, max_entries=5000)
+
+@st.cache_resource
+def get_blob_store():
+    """Content-addressed store of recipe texts; user records keep only the hash"""
+    return BlobStore("recipe_blobs.db")
+
+def store_recipe_text(text):
+    """Reference to `text` in the blob store, for saving in a user record"""
+    return get_blob_store().put(text)
+
+def recipe_text(value):
+    """Recipe text of a saved field, read from the blob store if it holds a reference"""
+    return get_blob_store().resolve(value)
+
+@st.cache_resource
+def get_api_pool():
+    """Worker threads for fanning out API Ninja lookups"""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="api-ninja")
+
+def fetch_api_ninja(http, cache, endpoint: str, query: str):
+    """GET `endpoint` for `query`, served from the response cache when possible.
+
+    Returns (status_code, data). Safe to call from worker threads: it never
+    touches Streamlit, so the session and cache are passed in.
+    """
+    key = cache.make_key(endpoint, prompt=query)
+    cached = cache.get(key)
+    if cached is not None:
+        return 200, json.loads(cached)
+
+    response = http.get(endpoint, params={"query": query}, timeout=10)
+    if response.status_code != 200:
+        return response.status_code, None
+    data = response.json()
+    cache.set(key, json.dumps(data))
+    return 200, data
+
 def get_recipe_from_api_ninja(dish_name: str):
     """Fetch recipe from API Ninja"""
     try:
-        headers = {"X-Api-Key": API_NINJA_KEY}
-        params = {"query": dish_name}
-        response = requests.get(RECIPE_API_ENDPOINT, headers=headers, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 429:
+        status, data = fetch_api_ninja(get_http_session(), get_api_cache(), RECIPE_API_ENDPOINT, dish_name)
+        if status == 429:
             st.warning("⏳ API rate limit reached. Please wait a moment.")
-            return None
-        else:
-            return None
+        return data
     except Exception as e:
         st.error(f"Error fetching recipe: {str(e)}")
         return None
@@ -308,24 +390,70 @@ def get_recipe_from_api_ninja(dish_name: str):
 def get_nutrition_info(ingredient: str):
     """Get nutrition info from API Ninja"""
     try:
-        headers = {"X-Api-Key": API_NINJA_KEY}
-        params = {"query": ingredient}
-        response = requests.get(NUTRITION_API_ENDPOINT, headers=headers, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return fetch_api_ninja(get_http_session(), get_api_cache(), NUTRITION_API_ENDPOINT, ingredient)[1]
     except:
         return None
 
+@st.cache_resource
+def get_nutrient_table():
+    """Local per-100 g nutrient table shared by every session"""
+    return NutrientTable("nutrients")
+
+@st.cache_resource
+def get_failed_nutrition_lookups():
+    """Ingredient -> time its nutrition lookup last failed, shared by every session"""
+    return {}
+
+def get_nutrition_batch(ingredients: list):
+    """Per-100 g nutrients for all ingredients at once as a DataFrame.
+
+    Ingredients already in the local table are answered from it; only the
+    misses are fetched (concurrently) and then stored for next time.
+    Ingredients the API doesn't know are stored as rows without data, and
+    failed lookups are held back for NUTRITION_RETRY_SECONDS, so a page
+    rerun doesn't wait on the same misses again.
+    """
+    table = get_nutrient_table()
+    failed = get_failed_nutrition_lookups()
+    now = time.time()
+    missing = [name for name in table.missing(ingredients)
+               if now - failed.get(name.strip().lower(), 0) > NUTRITION_RETRY_SECONDS]
+    if missing:
+        http, cache, pool = get_http_session(), get_api_cache(), get_api_pool()
+        lookups = {name: pool.submit(fetch_api_ninja, http, cache, NUTRITION_API_ENDPOINT, name)
+                   for name in missing}
+        fetched = {}
+        for name, lookup in lookups.items():
+            try:
+                status, items = lookup.result()
+            except Exception:
+                status, items = None, None
+            if status != 200:
+                failed[name.strip().lower()] = now
+            elif items:
+                fetched[name] = per_100g(items[0])
+            else:
+                fetched[name] = [float('nan')] * len(NUTRIENTS)
+        table.add_many(fetched)
+    return table.lookup(ingredients)
+
 def generate_custom_recipe(ingredients: list, diet_prefs=None, meal_type=None):
     """Generate recipe from ingredients using API"""
     try:
         with st.spinner("🔄 Generating your recipe..."):
-            for ingredient in ingredients[:3]:
-                recipe_data = get_recipe_from_api_ninja(ingredient)
+            # Look every ingredient up at once; the first one (in order) with a
+            # recipe wins, as before, but it only costs one round-trip
+            http, cache, pool = get_http_session(), get_api_cache(), get_api_pool()
+            lookups = [pool.submit(fetch_api_ninja, http, cache, RECIPE_API_ENDPOINT, ingredient)
+                       for ingredient in ingredients[:3]]
+            rate_limited = False
+            for lookup in lookups:
+                status, recipe_data = lookup.result()
+                rate_limited = rate_limited or status == 429
                 if recipe_data and len(recipe_data) > 0:
                     return recipe_data[0] if isinstance(recipe_data, list) else recipe_data
+            if rate_limited:
+                st.warning("⏳ API rate limit reached. Please wait a moment.")
             return None
     except Exception as e:
         st.error(f"Error: {str(e)}")
@@ -349,7 +477,7 @@ def check_login_required():
                     st.session_state.current_user = username
                     st.session_state.users = st.session_state.user_manager.users
                     st.success(message)
-                    st.rerun()
+                    rerun()
                 else:
                     st.error(message)
         
@@ -362,43 +490,46 @@ def check_login_required():
                     st.session_state.current_user = new_username
                     st.session_state.users = st.session_state.user_manager.users
                     st.success(message)
-                    st.rerun()
+                    rerun()
                 else:
                     st.error(message)
+        st.session_state.user_manager.commit()
         st.stop()
 
+def get_activity_log(user):
+    """Columnar activity log of `user` with daily rollups, rebuilt only when it changed elsewhere"""
+    log = st.session_state.get('activity_log_view')
+    if log is None or not log.tracks(user.get('activity_log')):
+        log = ActivityLog.for_user(user)
+        st.session_state.activity_log_view = log
+    return log
+
 def add_points(points, reason):
     """Add points and log activity"""
     user = st.session_state.users[st.session_state.current_user]
     user['points'] += points
-    user['activity_log'].append({
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "action": reason,
-        "points": points
-    })
+    get_activity_log(user).append(reason, points)
     st.session_state.user_manager.update_user_data(st.session_state.current_user, user)
 
-def search_ingredients(search_term: str, ingredients_list: list) -> list:
-    """Search ingredients with flexible matching"""
+def get_ingredient_catalog():
+    """Per-session ingredient catalog built once from the inventory"""
+    if 'ingredient_catalog' not in st.session_state:
+        st.session_state.ingredient_catalog = IngredientCatalog(st.session_state.inventory)
+    return st.session_state.ingredient_catalog
+
+def search_ingredients(search_term: str, extras=()) -> list:
+    """Indexed ingredient search with fuzzy matching and custom additions"""
+    catalog = get_ingredient_catalog()
     if not search_term:
-        return ingredients_list
-    
-    search_term = search_term.lower()
-    if search_term not in [i.lower() for i in ingredients_list]:
-        ingredients_list.append(search_term.title())
-    
-    matches = [item for item in ingredients_list 
-               if search_term in item.lower() or item.lower() in search_term or 
-               any(word in item.lower() for word in search_term.split())]
-    
-    return matches or [search_term.title()]
+        return catalog.view(extras)
+
+    matches = catalog.index(extras).search(search_term)
 
-def get_all_ingredients():
-    """Get all available ingredients"""
-    all_ingredients = []
-    for category_items in st.session_state.inventory.values():
-        all_ingredients.extend(category_items)
-    return list(set(all_ingredients))
+    # Offer the searched term itself, spelled the way the picker preselects it
+    term = search_term.title()
+    matches = [m for m in matches if m.lower() != term.lower()]
+    matches.insert(0, term)
+    return matches
 
 def get_user_mentions():
     """Get user preferences"""
@@ -465,7 +596,7 @@ def show_sidebar():
     
     if st.sidebar.button("Logout"):
         st.session_state.current_user = None
-        st.rerun()
+        rerun()
 
     return st.sidebar.selectbox("Select Feature", 
         ["Dashboard", "Profile", "Search", "Recipe Suggestions", "Leftover Management", 
@@ -489,9 +620,9 @@ def show_user_profile(user_data):
     
     with tabs[0]:
         st.subheader("📊 Activity History")
-        if user_data['activity_log']:
-            df = pd.DataFrame(user_data['activity_log'])
-            st.dataframe(df, hide_index=True)
+        activity = get_activity_log(user_data)
+        if len(activity):
+            st.dataframe(activity.entries(), hide_index=True)
         else:
             st.info("No activity recorded yet")
 
@@ -502,7 +633,7 @@ def show_user_profile(user_data):
             for recipe in recipes:
                 with st.expander(f"{recipe.get('date', 'N/A')} - {recipe.get('name', 'Recipe')}"):
                     st.write(f"**Ingredients:** {recipe.get('ingredients', 'N/A')}")
-                    st.write(f"**Details:** {recipe.get('details', 'N/A')}")
+                    st.write(f"**Details:** {recipe_text(recipe.get('details', 'N/A'))}")
         else:
             st.info("No recipes created yet")
 
@@ -653,16 +784,11 @@ elif app_mode == "Recipe Suggestions":
         calorie_limit = st.number_input("Calorie limit", min_value=100, max_value=5000, value=500)
 
     st.subheader("🥘 Ingredients Selection")
-    all_ingredients = get_all_ingredients()
     search_term = st.text_input("Search ingredients")
-    
-    if search_term:
-        filtered_ingredients = search_ingredients(search_term, all_ingredients)
-    else:
-        filtered_ingredients = all_ingredients
+    filtered_ingredients = search_ingredients(search_term)
     
     selected_ingredients = st.multiselect("Selected Ingredients", 
-                                         options=sorted(filtered_ingredients),
+                                         options=filtered_ingredients,
                                          default=[search_term.title()] if search_term else [])
 
     mentions = get_user_mentions()
@@ -680,7 +806,7 @@ elif app_mode == "Recipe Suggestions":
                 user['created_recipes'].append({
                     'name': recipe_data.get('title', 'Recipe'),
                     'ingredients': selected_ingredients,
-                    'details': recipe_data.get('instructions', 'N/A'),
+                    'details': store_recipe_text(recipe_data.get('instructions', 'N/A')),
                     'date': datetime.now().strftime("%Y-%m-%d"),
                     'type': 'recipe'
                 })
@@ -723,7 +849,7 @@ elif app_mode == "Leftover Management":
             add_points(2, f"Added leftover: {ingredient_name}")
             check_achievements(user, "leftover")
             st.session_state.user_manager.update_user_data(st.session_state.current_user, user)
-            st.rerun()
+            rerun()
     
     st.subheader("Current Leftovers")
     user = st.session_state.users[st.session_state.current_user]
@@ -732,6 +858,21 @@ elif app_mode == "Leftover Management":
         leftovers_df = pd.DataFrame(user['leftover_ingredients'])
         st.dataframe(leftovers_df, hide_index=True)
         
+        # Nutrition of the whole leftover batch, computed locally in one go
+        nutrition = get_nutrition_batch(leftovers_df['name'].tolist())
+        amounts = nutrition.mul(leftovers_df['quantity'].to_numpy(dtype=float) / 100, axis=0)
+        totals = amounts.sum(min_count=1)
+        col1, col2, col3, col4 = st.columns(4)
+        for col, (label, nutrient, unit) in zip((col1, col2, col3, col4), [
+            ("Calories", "calories", "kcal"), ("Protein", "protein_g", "g"),
+            ("Carbs", "carbohydrates_total_g", "g"), ("Fat", "fat_total_g", "g")
+        ]):
+            value = totals[nutrient]
+            col.metric(f"Total {label}", "N/A" if pd.isna(value) else f"{value:,.0f} {unit}")
+        unknown = nutrition.index[nutrition['calories'].isna()].unique().tolist()
+        if unknown:
+            st.caption(f"No calorie data for: {', '.join(unknown)}")
+        
         st.subheader("Generate Recipe from Leftovers")
         cooking_time = st.slider("Max Cooking Time (min)", 10, 120, 30)
         selected = st.multiselect("Select ingredients", options=[i['name'] for i in user['leftover_ingredients']])
@@ -748,7 +889,7 @@ elif app_mode == "Leftover Management":
                 user['leftovers'].append({
                     'name': f"Leftover Recipe ({datetime.now().strftime('%Y-%m-%d')})",
                     'ingredients': selected,
-                    'recipe': recipe_data.get('instructions', 'N/A'),
+                    'recipe': store_recipe_text(recipe_data.get('instructions', 'N/A')),
                     'date': datetime.now().strftime("%Y-%m-%d %H:%M")
                 })
                 
@@ -839,7 +980,7 @@ elif app_mode == "Event Manager":
                 add_points(10, f"Created event: {event_name}")
                 st.session_state.user_manager.update_user_data(st.session_state.current_user, user)
                 st.success("Event saved successfully!")
-                st.rerun()
+                rerun()
             else:
                 st.error("Please fill in all fields")
     
@@ -858,7 +999,7 @@ elif app_mode == "Event Manager":
                     
                     if st.button(f"Delete {idx}", key=f"delete_{idx}"):
                         st.session_state.events.pop(idx)
-                        st.rerun()
+                        rerun()
         else:
             st.info("No events planned yet")
     
@@ -915,7 +1056,7 @@ elif app_mode == "Cooking Quiz":
             st.session_state.current_question = random.choice(new_questions)
         
         if st.button("Next Question"):
-            st.rerun()
+            rerun()
 
 elif app_mode == "Beverage Generator":
     st.title("🍹 Beverage Generator")
@@ -925,17 +1066,9 @@ elif app_mode == "Beverage Generator":
         bev_type = st.selectbox("Beverage Type", ["Mocktail", "Juice", "Smoothie", "Tea", "Coffee", "Milkshake"])
         ingredient_search = st.text_input("Search ingredients")
         
-        all_ingredients = get_all_ingredients() + [
-            "Mint", "Lemon", "Lime", "Orange", "Mango", "Strawberry", "Honey",
-            "Ginger", "Cinnamon", "Ice", "Milk", "Yogurt", "Coconut Milk"
-        ]
-        
-        if ingredient_search:
-            filtered = search_ingredients(ingredient_search, all_ingredients)
-        else:
-            filtered = all_ingredients
+        filtered = search_ingredients(ingredient_search, BEVERAGE_INGREDIENTS)
         
-        selected_bev = st.multiselect("Ingredients", options=sorted(filtered), default=[ingredient_search.title()] if ingredient_search else [])
+        selected_bev = st.multiselect("Ingredients", options=filtered, default=[ingredient_search.title()] if ingredient_search else [])
     
     with col2:
         seasonal = st.selectbox("Season", ["All Seasons", "Summer", "Winter", "Spring", "Fall"])
@@ -958,7 +1091,7 @@ elif app_mode == "Beverage Generator":
                     'name': recipe_data.get('title', 'Beverage'),
                     'type': 'beverage',
                     'ingredients': selected_bev,
-                    'details': recipe_data.get('instructions', 'N/A'),
+                    'details': store_recipe_text(recipe_data.get('instructions', 'N/A')),
                     'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
                     'season': seasonal,
                     'dietary_restrictions': dietary
@@ -980,17 +1113,9 @@ elif app_mode == "Dessert Generator":
         dessert_type = st.selectbox("Dessert Type", ["Cake", "Pie", "Cookie", "Pudding", "Ice Cream", "Brownie"])
         ingredient_search = st.text_input("Search ingredients")
         
-        all_ingredients = get_all_ingredients() + [
-            "Sugar", "Flour", "Butter", "Eggs", "Milk", "Cream", "Chocolate",
-            "Vanilla", "Cinnamon", "Nuts", "Berries", "Honey", "Caramel"
-        ]
-        
-        if ingredient_search:
-            filtered = search_ingredients(ingredient_search, all_ingredients)
-        else:
-            filtered = all_ingredients
+        filtered = search_ingredients(ingredient_search, DESSERT_INGREDIENTS)
         
-        selected_des = st.multiselect("Ingredients", options=sorted(filtered), default=[ingredient_search.title()] if ingredient_search else [])
+        selected_des = st.multiselect("Ingredients", options=filtered, default=[ingredient_search.title()] if ingredient_search else [])
     
     with col2:
         cuisine = st.selectbox("Cuisine", ["International", "French", "Italian", "Indian", "American"])
@@ -1014,7 +1139,7 @@ elif app_mode == "Dessert Generator":
                     'type': 'dessert',
                     'cuisine': cuisine,
                     'ingredients': selected_des,
-                    'details': recipe_data.get('instructions', 'N/A'),
+                    'details': store_recipe_text(recipe_data.get('instructions', 'N/A')),
                     'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
                     'dietary_restrictions': dietary
                 })
@@ -1027,3 +1152,5 @@ elif app_mode == "Dessert Generator":
         else:
 
             st.warning("Please select ingredients")
+
+st.session_state.user_manager.commit()
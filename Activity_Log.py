@@ -0,0 +1,221 @@
+import bisect
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 24 * 3600
+_EPOCH = datetime(1970, 1, 1)
+
+# Range of the points of a single event, which are handled as int16
+POINTS_MIN, POINTS_MAX = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+
+
+def empty_activity_log():
+    """Stored form of an activity log with no events.
+
+    Each event is one [time, action, points] row of ints: wall-clock seconds
+    since 1970-01-01, a code keyed (as text) in `actions`, and the points.
+    A whole row is appended at once, so merging two sessions' appends (see
+    User_Data._merge_record) can never pair one event's time with another's
+    action.
+    """
+    return {'actions': {}, 'events': []}
+
+
+def _action_code(actions, action):
+    """Code of `action` in the `actions` table, adding it if needed.
+
+    Codes come from a hash of the action text rather than its position, so
+    two sessions interning different actions concurrently pick different
+    codes and their tables merge as plain key unions. A collision probes
+    the next code.
+    """
+    code = int.from_bytes(hashlib.sha1(action.encode('utf-8')).digest()[:4], 'big') & 0x7fffffff
+    while actions.get(str(code), action) != action:
+        code = (code + 1) & 0x7fffffff
+    actions[str(code)] = action
+    return code
+
+
+def _seconds(date):
+    """Wall-clock seconds since 1970-01-01 for a logged "%Y-%m-%d %H:%M" date"""
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return int((datetime.strptime(date, fmt) - _EPOCH).total_seconds())
+        except (TypeError, ValueError):
+            continue
+    return 0
+
+
+def columnar_activity_log(value):
+    """`value` in the stored form.
+
+    A legacy list of event dicts is kept untouched under 'legacy' rather than
+    re-encoded: two sessions converting the same list then produce the same
+    value, which merges cleanly.
+    """
+    if isinstance(value, dict):
+        if 'time' in value:
+            # Earlier logs kept parallel columns and numbered actions by position
+            labels = value['actions']
+            value['actions'] = {}
+            value['events'] = [
+                [time, _action_code(value['actions'], labels[code]), points]
+                for time, code, points in zip(value.pop('time'), value.pop('action'), value.pop('points'))
+            ]
+        return value
+    log = empty_activity_log()
+    if value:
+        log['legacy'] = list(value)
+    return log
+
+
+def convert_legacy_events(log):
+    """Rewrite the legacy event dicts of a stored log as event rows; returns how many.
+
+    Kept out of the normal load path: a session still holding the legacy
+    list would merge its own appends against the rewritten events as a
+    conflict. Run it through migrate_activity_logs while the app is stopped.
+    """
+    legacy = log.pop('legacy', [])
+    log['events'][:0] = [
+        [_seconds(entry.get('date')), _action_code(log['actions'], str(entry.get('action', ''))),
+         int(entry.get('points', 0))]
+        for entry in legacy
+    ]
+    return len(legacy)
+
+
+class ActivityLog:
+    """Columnar view over a user's `activity_log` with per-day rollups.
+
+    The stored dict stays the JSON-compatible source of truth and is
+    appended to in place, so saving the user works as before. Per-day point
+    and event totals are kept up to date on every append and stored with the
+    log under 'daily' as [event count, [[day, points, events], ...]], so the
+    timeline and totals cost O(days) instead of O(events), also when a new
+    session opens the log. A stored rollup whose count doesn't match the
+    events (e.g. after two sessions' appends were merged) is rebuilt.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._codes = {action: int(code) for code, action in data['actions'].items()}
+        self._count = len(data['events'])
+        daily = data.get('daily')
+        if isinstance(daily, list) and len(daily) == 2 and daily[0] == len(self):
+            self._days = [day for day, _, _ in daily[1]]
+            self._day_points = [points for _, points, _ in daily[1]]
+            self._day_events = [events for _, _, events in daily[1]]
+            return
+        times, points = self._column('time'), self._column('points')
+        day_list, inverse = np.unique(times // SECONDS_PER_DAY, return_inverse=True)
+        self._days = day_list.tolist()
+        self._day_points = np.bincount(inverse, weights=points, minlength=len(day_list)).astype(np.int64).tolist()
+        self._day_events = np.bincount(inverse, minlength=len(day_list)).tolist()
+        self._store_daily()
+
+    def _store_daily(self):
+        # A single list, so a merge of two sessions' rollups keeps one side
+        # whole (and its count then shows it is stale) instead of adding counts
+        self.data['daily'] = [len(self), [list(row) for row in zip(self._days, self._day_points, self._day_events)]]
+
+    def _column(self, column, start=0):
+        """One column (time, action or points) of the events from `start` on, legacy ones first"""
+        legacy = self.data.get('legacy', [])
+        events = self.data['events'][max(start - len(legacy), 0):]
+        legacy = legacy[start:]
+        if column == 'action':
+            actions = self.data['actions']
+            return np.array([str(entry.get('action', '')) for entry in legacy] +
+                            [actions.get(str(row[1]), '') for row in events], dtype=object)
+        if column == 'time':
+            return np.array([_seconds(entry.get('date')) for entry in legacy] +
+                            [row[0] for row in events], dtype=np.int64)
+        return np.array([int(entry.get('points', 0)) for entry in legacy] +
+                        [row[2] for row in events], dtype=np.int16)
+
+    @classmethod
+    def for_user(cls, user):
+        """Log of `user`, converting a legacy list in the record first"""
+        log = user['activity_log'] = columnar_activity_log(user.get('activity_log'))
+        return cls(log)
+
+    def tracks(self, data):
+        """True while `data` is still the log this view indexes, unchanged from outside"""
+        return data is self.data and len(data['events']) == self._count
+
+    def __len__(self):
+        return len(self.data.get('legacy', [])) + self._count
+
+    def append(self, action, points, when=None):
+        if not POINTS_MIN <= points <= POINTS_MAX:
+            raise ValueError(f"points must fit in int16, got {points}")
+        when = when or datetime.now()
+        seconds = int((when.replace(microsecond=0) - _EPOCH).total_seconds())
+        code = self._codes.get(action)
+        if code is None:
+            code = self._codes[action] = _action_code(self.data['actions'], action)
+        self.data['events'].append([seconds, code, int(points)])
+        self._count += 1
+
+        day = seconds // SECONDS_PER_DAY
+        i = bisect.bisect_left(self._days, day)
+        if i == len(self._days) or self._days[i] != day:
+            self._days.insert(i, day)
+            self._day_points.insert(i, 0)
+            self._day_events.insert(i, 0)
+        self._day_points[i] += int(points)
+        self._day_events[i] += 1
+        self._store_daily()
+
+    def total_points(self):
+        return sum(self._day_points)
+
+    def daily(self):
+        """Points and events per active day, with the running points total"""
+        points = np.asarray(self._day_points, dtype=np.int64)
+        return pd.DataFrame({
+            'day': pd.to_datetime(np.asarray(self._days, dtype=np.int64), unit='D'),
+            'points': points,
+            'events': np.asarray(self._day_events, dtype=np.int64),
+            'total': np.cumsum(points),
+        })
+
+    def entries(self, limit=None):
+        """Events as a date/action/points DataFrame, optionally only the latest `limit`"""
+        start = 0 if limit is None else max(len(self) - limit, 0)
+        return pd.DataFrame({
+            'date': pd.to_datetime(self._column('time', start), unit='s').strftime("%Y-%m-%d %H:%M"),
+            'action': self._column('action', start),
+            'points': self._column('points', start),
+        })
+
+
+def migrate_activity_logs(manager):
+    """Convert every user's legacy activity entries to event rows and save the users that changed.
+
+    Meant to be run once, while the app is stopped (see convert_legacy_events).
+    """
+    converted = 0
+    with manager.unit_of_work():
+        for username in list(manager.users):
+            user = manager.users[username]
+            log = columnar_activity_log(user.get('activity_log'))
+            count = convert_legacy_events(log)
+            if count:
+                # Building the view also stores the day rollups with the log
+                manager.update_user_data(username, {'activity_log': ActivityLog(log).data})
+                converted += count
+    return converted
+
+
+if __name__ == "__main__":
+    import sys
+    from User_Data import UserDataManager
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "user_data.json"
+    converted = migrate_activity_logs(UserDataManager(source))
+    print(f"Converted {converted} legacy activity entries in {source} to event rows")
@@ -0,0 +1,125 @@
+import hashlib
+import sqlite3
+import threading
+import zlib
+
+# Stored values that start with this are references into the blob store
+REF_PREFIX = "blob:"
+
+# Shorter texts (menu summaries, "N/A") stay inline; a ref would not be smaller
+MIN_BLOB_LENGTH = 256
+
+# list field of a user record -> key of the recipe text in each of its items
+RECIPE_TEXT_FIELDS = {
+    'created_recipes': 'details',
+    'leftovers': 'recipe',
+    'recipe_searches': 'details',
+    'saved_menus': 'details',
+}
+
+
+def is_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+class BlobStore:
+    """Content-addressed store of zlib-compressed recipe texts.
+
+    A text is keyed by the SHA-256 of its bytes, so the same recipe saved by
+    many users (or searched many times) is stored once. User records keep
+    only the short "blob:<hash>" reference and the body is read back when it
+    is displayed.
+    """
+
+    def __init__(self, db_path="recipe_blobs.db", min_length=MIN_BLOB_LENGTH):
+        self.db_path = db_path
+        self.min_length = min_length
+        self._lock = threading.Lock()
+        # Shared by every session/thread in the process, guarded by our own lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " hash TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL,"
+                " size INTEGER NOT NULL)"
+            )
+
+    def put(self, text):
+        """Store `text` and return its reference; short or non-text values are returned as is"""
+        if not isinstance(text, str) or is_ref(text) or len(text) < self.min_length:
+            return text
+        raw = text.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)",
+                (digest, zlib.compress(raw, 6), len(raw))
+            )
+        return REF_PREFIX + digest
+
+    def get(self, ref):
+        """The text behind `ref`, or None if it is not in the store"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blobs WHERE hash = ?", (ref[len(REF_PREFIX):],)
+            ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def resolve(self, value, default="Recipe text is no longer available"):
+        """Text for a stored field: references are looked up, inline text passes through"""
+        if not is_ref(value):
+            return value
+        text = self.get(value)
+        return default if text is None else text
+
+    def externalize(self, user):
+        """Move the inline recipe texts of one user record into the store; returns how many moved"""
+        moved = 0
+        for field, key in RECIPE_TEXT_FIELDS.items():
+            items = user.get(field)
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if not isinstance(item, dict) or key not in item:
+                    continue
+                ref = self.put(item[key])
+                if ref is not item[key]:
+                    item[key] = ref
+                    moved += 1
+        return moved
+
+    def stats(self):
+        with self._lock:
+            blobs, size, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+            ).fetchone()
+        return {'blobs': blobs, 'bytes': size, 'stored_bytes': stored}
+
+
+def migrate_recipe_texts(manager, store):
+    """Move every user's inline recipe texts into `store` and save the users that changed"""
+    moved = 0
+    with manager.unit_of_work():
+        for username in list(manager.users):
+            count = store.externalize(manager.users[username])
+            if count:
+                moved += count
+                manager.update_user_data(username, {})
+    return moved
+
+
+if __name__ == "__main__":
+    import sys
+    from User_Data import UserDataManager
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "user_data.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else "recipe_blobs.db"
+    manager = UserDataManager(source)
+    store = BlobStore(target)
+    moved = migrate_recipe_texts(manager, store)
+    stats = store.stats()
+    print(f"Moved {moved} recipe texts from {source} into {target}")
+    print(f"  {stats['blobs']} unique texts, {stats['bytes']:,} bytes, "
+          f"{stats['stored_bytes']:,} bytes compressed")
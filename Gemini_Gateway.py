@@ -0,0 +1,460 @@
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# status is one of "ok", "timeout", "cancelled", "blocked" (no text came back,
+# e.g. the safety filters withheld the whole response) or "error"
+GenerationResult = namedtuple("GenerationResult", ["status", "text", "error"])
+
+
+class GenerationJob:
+    """One generation running on the gateway's worker pool.
+
+    Chunks are appended as they arrive so the Streamlit script can render
+    them while the worker keeps generating; waiting never goes past the job's
+    deadline.
+    """
+
+    def __init__(self, prompt, timeout):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.submitted = time.monotonic()
+        self.deadline = self.submitted + timeout
+        self.finished_at = None
+        self.status = "running"
+        self.error = None
+        self._parts = []
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._changed = threading.Condition()
+
+    @classmethod
+    def finished(cls, prompt, text):
+        """An already completed job, e.g. for a cached response"""
+        job = cls(prompt, 0)
+        job._put(text)
+        job._finish("ok")
+        return job
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop the job; the worker stops reading the stream at its next chunk"""
+        self._cancelled.set()
+        self._finish("cancelled")
+
+    def _put(self, part):
+        with self._changed:
+            self._parts.append(part)
+            self._changed.notify_all()
+
+    def _finish(self, status, error=None):
+        with self._changed:
+            if self.status != "running":
+                return False
+            self.status = status
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._done.set()
+            self._changed.notify_all()
+        return True
+
+    def _expire(self):
+        if self._finish("timeout"):
+            self._cancelled.set()
+
+    def iter_chunks(self):
+        """Yield text chunks as they are generated, stopping at the deadline"""
+        seen = 0
+        while True:
+            with self._changed:
+                while seen == len(self._parts) and not self.done():
+                    remaining = self.deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(min(remaining, 0.5))
+                new_parts = self._parts[seen:]
+                finished = self.done()
+            if not new_parts and not finished:
+                self._expire()
+                continue
+            for part in new_parts:
+                yield part
+            seen += len(new_parts)
+            if finished:
+                return
+
+    def result(self):
+        """Wait (at most until the deadline) and return a GenerationResult"""
+        if not self._done.wait(max(0, self.deadline - time.monotonic())):
+            self._expire()
+        return GenerationResult(self.status, self.text if self.status == "ok" else None, self.error)
+
+
+class JobHandle:
+    """One caller's view of a GenerationJob that may be shared with others.
+
+    Identical prompts submitted while a job is in flight share that job;
+    each caller gets its own handle (and id), and cancelling a handle only
+    detaches that caller. The job itself is cancelled once every handle on
+    it has been cancelled.
+    """
+
+    def __init__(self, job, release):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self._release = release
+        self._cancelled_at = None
+
+    @property
+    def prompt(self):
+        return self.job.prompt
+
+    @property
+    def deadline(self):
+        return self.job.deadline
+
+    @property
+    def finished_at(self):
+        return self._cancelled_at if self._cancelled_at is not None else self.job.finished_at
+
+    def done(self):
+        return self._cancelled_at is not None or self.job.done()
+
+    def cancel(self):
+        if self._cancelled_at is None and not self.job.done():
+            self._cancelled_at = time.monotonic()
+            self._release(self.job)
+
+    def iter_chunks(self):
+        for part in self.job.iter_chunks():
+            if self._cancelled_at is not None:
+                return
+            yield part
+
+    def result(self):
+        if self._cancelled_at is not None:
+            return GenerationResult("cancelled", None, None)
+        return self.job.result()
+
+
+def is_rate_limit_error(error):
+    """True for Gemini quota errors (HTTP 429 / ResourceExhausted)"""
+    return "429" in str(error) or "ResourceExhausted" in type(error).__name__ or "ResourceExhausted" in str(error)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token; returns 0 on success or the seconds until one is available"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, deadline=None, cancelled=None):
+        """Block until a token is taken; False if the deadline passes or `cancelled` is set first"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            if cancelled is not None:
+                if cancelled.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def drain(self):
+        """Empty the bucket after the upstream reported its quota exhausted"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0)
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class GeminiGateway:
+    """Runs generations on a bounded worker pool with a real deadline.
+
+    A hung upstream call can only ever tie up one of `max_workers` threads;
+    callers stop waiting when the deadline passes, and jobs that are
+    cancelled or expired before a worker picks them up are never started.
+
+    Requests are paced by a process-wide token bucket (`requests_per_minute`)
+    and queued per session; the dispatcher serves sessions round-robin so a
+    single busy tab cannot starve everyone else. Quota errors are retried
+    with jittered exponential backoff while the deadline allows.
+
+    Every job is kept in a result store under its id, independently of the
+    Streamlit script that submitted it, so a page can keep just the id and
+    pick the job up again after a rerun. Finished jobs are dropped
+    `result_ttl` seconds after they complete.
+
+    Submissions with the same `key` while a job for it is in flight are
+    coalesced onto that job (single-flight), so concurrent identical
+    prompts cost one upstream call.
+    """
+
+    def __init__(self, max_workers=8, requests_per_minute=60, burst=None,
+                 max_retries=3, backoff_base=1.0, backoff_cap=20.0, result_ttl=600):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+        self._slots = threading.Semaphore(max_workers)
+        self._bucket = TokenBucket(requests_per_minute / 60, burst or requests_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._inflight = {}
+        self._refs = {}
+        self._queues = OrderedDict()
+        self._queued = threading.Condition()
+        self._metrics = {
+            'submitted': 0, 'started': 0, 'completed': 0, 'failed': 0,
+            'retries': 0, 'rate_limited': 0, 'coalesced': 0, 'running': 0, 'max_queue_depth': 0,
+            'queue_wait_total': 0.0,
+        }
+        self._metrics_lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="gemini-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, stream_fn, prompt, timeout=60, on_success=None, session=None, key=None):
+        """Queue `stream_fn(prompt, timeout)` (an iterator of text chunks) for a background worker.
+
+        `timeout` is the seconds left until the job's deadline; stream_fn must
+        pass it on to its transport so a hung connection can't hold a worker
+        (and its slot) past the deadline.
+
+        Returns a JobHandle. If a job with the same `key` is still in flight
+        the handle is attached to it instead of starting a new one.
+        """
+        with self._jobs_lock:
+            job = self._inflight.get(key) if key is not None else None
+            if job is not None and not job.done():
+                self._refs[job.id] += 1
+                with self._metrics_lock:
+                    self._metrics['coalesced'] += 1
+                return self._store(JobHandle(job, self._release))
+            job = GenerationJob(prompt, timeout)
+            job.key = key
+            self._refs[job.id] = 1
+            if key is not None:
+                self._inflight[key] = job
+            handle = self._store(JobHandle(job, self._release))
+        with self._queued:
+            self._queues.setdefault(session, deque()).append((job, stream_fn, on_success))
+            depth = sum(len(q) for q in self._queues.values())
+            self._queued.notify()
+        with self._metrics_lock:
+            self._metrics['submitted'] += 1
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], depth)
+        return handle
+
+    def completed(self, prompt, text):
+        """Store an already finished job, e.g. for a cached response"""
+        job = GenerationJob.finished(prompt, text)
+        with self._jobs_lock:
+            return self._store(JobHandle(job, self._release))
+
+    def get(self, job_id):
+        """The JobHandle stored under `job_id`, or None once it has expired from the store"""
+        with self._jobs_lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def _store(self, handle):
+        # Called with _jobs_lock held
+        self._purge()
+        self._jobs[handle.id] = handle
+        return handle
+
+    def _release(self, job):
+        """Drop one handle's interest in `job`, cancelling it when nobody is left"""
+        with self._jobs_lock:
+            refs = self._refs.get(job.id, 0) - 1
+            if refs > 0:
+                self._refs[job.id] = refs
+                return
+            self._forget(job)
+        job.cancel()
+
+    def _forget(self, job):
+        # Called with _jobs_lock held
+        self._refs.pop(job.id, None)
+        key = getattr(job, "key", None)
+        if key is not None and self._inflight.get(key) is job:
+            del self._inflight[key]
+
+    def _discard(self, job):
+        with self._jobs_lock:
+            self._forget(job)
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, handle in self._jobs.items()
+            if handle.finished_at is not None and now - handle.finished_at > self.result_ttl
+            or handle.finished_at is None and now > handle.deadline + self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _next_entry(self):
+        """Pop the next live job, taking one from each session in turn"""
+        with self._queued:
+            while True:
+                while not self._queues:
+                    self._queued.wait()
+                session, queue = next(iter(self._queues.items()))
+                entry = queue.popleft()
+                del self._queues[session]
+                if queue:
+                    self._queues[session] = queue  # back of the line
+                job = entry[0]
+                if not job.done() and time.monotonic() > job.deadline:
+                    job._expire()
+                if job.done():
+                    self._discard(job)
+                    continue
+                return entry
+
+    def _dispatch(self):
+        while True:
+            entry = self._next_entry()
+            job = entry[0]
+            self._slots.acquire()
+            if not self._bucket.acquire(job.deadline, job._cancelled):
+                self._slots.release()
+                if not job.done():
+                    job._expire()
+                self._discard(job)
+                continue
+            with self._metrics_lock:
+                self._metrics['started'] += 1
+                self._metrics['running'] += 1
+                self._metrics['queue_wait_total'] += time.monotonic() - job.submitted
+            self._pool.submit(self._run, *entry)
+
+    def _run(self, job, stream_fn, on_success):
+        try:
+            self._generate(job, stream_fn, on_success)
+        finally:
+            self._discard(job)
+            self._slots.release()
+            with self._metrics_lock:
+                self._metrics['running'] -= 1
+                if job.status == "ok":
+                    self._metrics['completed'] += 1
+                elif job.status in ("error", "blocked"):
+                    self._metrics['failed'] += 1
+
+    def _generate(self, job, stream_fn, on_success):
+        attempt = 0
+        while True:
+            if job.done():
+                return
+            if time.monotonic() > job.deadline:
+                job._expire()
+                return
+            try:
+                self._stream(job, stream_fn)
+                break
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    job._finish("error", e)
+                    return
+                self._bucket.drain()
+                with self._metrics_lock:
+                    self._metrics['rate_limited'] += 1
+                # Retrying is only safe before any text reached the caller
+                if job._parts or attempt >= self.max_retries:
+                    job._finish("error", e)
+                    return
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if job.deadline - time.monotonic() <= delay:
+                    job._finish("error", e)
+                    return
+                attempt += 1
+                with self._metrics_lock:
+                    self._metrics['retries'] += 1
+                if job._cancelled.wait(delay):
+                    return
+                if not self._bucket.acquire(job.deadline, job._cancelled):
+                    if not job.done():
+                        job._expire()
+                    return
+        if not job.text.strip():
+            job._finish("blocked", ValueError("The model returned no text for this prompt"))
+            return
+        if job._finish("ok") and on_success is not None:
+            on_success(job.text)
+
+    def _stream(self, job, stream_fn):
+        stream = stream_fn(job.prompt, max(job.deadline - time.monotonic(), 1.0))
+        try:
+            for part in stream:
+                if job.cancelled():
+                    return
+                if time.monotonic() > job.deadline:
+                    job._expire()
+                    return
+                job._put(part)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    def stats(self):
+        """Queue depth and throughput counters for monitoring"""
+        with self._queued:
+            queued = sum(len(q) for q in self._queues.values())
+            sessions = len(self._queues)
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        wait_total = metrics.pop('queue_wait_total')
+        metrics.update({
+            'queued': queued,
+            'queued_sessions': sessions,
+            'avg_queue_wait': wait_total / metrics['started'] if metrics['started'] else 0,
+            'tokens_available': self._bucket.available(),
+            'stored_jobs': len(self._jobs),
+        })
+        return metrics
@@ -0,0 +1,274 @@
+import bisect
+from collections import defaultdict
+
+GRAM_SIZE = 3
+FUZZY_THRESHOLD = 0.45
+MAX_CONTAINED_TERM = 64
+
+
+def _grams(text, size=GRAM_SIZE):
+    """Every substring of `text` up to `size` characters long"""
+    grams = set()
+    for n in range(1, size + 1):
+        for i in range(len(text) - n + 1):
+            grams.add(text[i:i + n])
+    return grams
+
+
+def _trigrams(text):
+    """Padded trigrams used for typo tolerant matching"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IngredientIndex:
+    """Prebuilt search index over an ingredient catalog.
+
+    Names are lowercased once when they are added. Substring lookups go
+    through an n-gram index and whole words through a token index, so a
+    search only ever touches the names that can match it. Names sharing
+    enough trigrams with the search term are returned as fuzzy matches.
+    """
+
+    def __init__(self, items=()):
+        self.items = []
+        self._lower = []
+        self._ids = {}
+        self._grams = defaultdict(set)
+        self._tokens = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        self._trigram_counts = []
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item.lower() in self._ids
+
+    def add(self, item):
+        """Index `item` unless a name differing only in case is already there"""
+        lower = item.lower()
+        if lower in self._ids:
+            return self._ids[lower]
+        item_id = len(self.items)
+        self.items.append(item)
+        self._lower.append(lower)
+        self._ids[lower] = item_id
+        for gram in _grams(lower):
+            self._grams[gram].add(item_id)
+        for token in lower.split():
+            self._tokens[token].add(item_id)
+        trigrams = _trigrams(lower)
+        for gram in trigrams:
+            self._trigrams[gram].add(item_id)
+        self._trigram_counts.append(len(trigrams))
+        return item_id
+
+    def _containing(self, word):
+        """Ids of names that contain `word` as a substring"""
+        if len(word) <= GRAM_SIZE:
+            return set(self._grams.get(word, ()))
+        grams = sorted(
+            (self._grams.get(word[i:i + GRAM_SIZE], set()) for i in range(len(word) - GRAM_SIZE + 1)),
+            key=len
+        )
+        candidates = set(grams[0])
+        for ids in grams[1:]:
+            candidates &= ids
+            if not candidates:
+                break
+        return {i for i in candidates if word in self._lower[i]}
+
+    def _contained_in(self, term):
+        """Ids of names that appear inside `term`, e.g. onion for red onion rings"""
+        if len(term) > MAX_CONTAINED_TERM:
+            return set()
+        found = set()
+        for start in range(len(term)):
+            for end in range(start + 1, len(term) + 1):
+                item_id = self._ids.get(term[start:end])
+                if item_id is not None:
+                    found.add(item_id)
+        return found
+
+    def _fuzzy(self, term):
+        """Ids and similarity of names sharing enough trigrams with `term`"""
+        term_grams = _trigrams(term)
+        shared = defaultdict(int)
+        for gram in term_grams:
+            for item_id in self._trigrams.get(gram, ()):
+                shared[item_id] += 1
+        scores = {}
+        for item_id, count in shared.items():
+            similarity = 2 * count / (len(term_grams) + self._trigram_counts[item_id])
+            if similarity >= FUZZY_THRESHOLD:
+                scores[item_id] = similarity
+        return scores
+
+    def _rank(self, item_id, term, words, whole_words):
+        lower = self._lower[item_id]
+        if lower == term:
+            return 0
+        if lower.startswith(term):
+            return 1
+        if item_id in whole_words:
+            return 2
+        if any(token.startswith(term) for token in lower.split()):
+            return 2
+        if term in lower:
+            return 3
+        if lower in term:
+            return 4
+        if all(word in lower for word in words):
+            return 5
+        return 6
+
+    def search(self, term, limit=None):
+        """Names matching `term`, best matches first.
+
+        A name matches when it contains the term or any of its words, or is
+        itself contained in the term; typos fall back to trigram similarity.
+        """
+        term = " ".join(term.lower().split())
+        if not term:
+            return list(self.items)
+        words = term.split()
+
+        whole_words = set()
+        for word in words:
+            whole_words |= self._tokens.get(word, set())
+
+        matches = self._contained_in(term)
+        for word in words:
+            matches |= self._containing(word)
+        ranked = sorted(
+            matches,
+            key=lambda i: (self._rank(i, term, words, whole_words), len(self._lower[i]), self._lower[i])
+        )
+        if limit is not None and len(ranked) >= limit:
+            return [self.items[i] for i in ranked[:limit]]
+
+        fuzzy = self._fuzzy(term)
+        ranked.extend(sorted(
+            (i for i in fuzzy if i not in matches),
+            key=lambda i: (-fuzzy[i], self._lower[i])
+        ))
+
+        results = [self.items[i] for i in ranked]
+        return results[:limit] if limit is not None else results
+
+
+class IngredientCatalog:
+    """Versioned catalog over an inventory of category -> ingredient names.
+
+    Sorted, de-duplicated (ignoring case) views are computed once per
+    version and reused across reruns. add() and remove() update the
+    inventory, the sorted views and the search index in place instead of
+    rebuilding them.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.version = 0
+        self._names = {}
+        self._refs = {}
+        self._sorted = []
+        self._categories = {}
+        self._category_sorted = {}
+        self._index = None
+        self._views = {}
+        for category, items in inventory.items():
+            names = self._categories.setdefault(category, {})
+            for item in items:
+                lower = item.lower()
+                if lower not in names:
+                    names[lower] = item
+                    self._ref(lower, item)
+            self._category_sorted[category] = sorted(names)
+        self._sorted = sorted(self._names)
+
+    def _ref(self, lower, item):
+        """Count one more category holding `lower`; True if it is new to the catalog"""
+        self._refs[lower] = self._refs.get(lower, 0) + 1
+        if self._refs[lower] == 1:
+            self._names[lower] = item
+            return True
+        return False
+
+    def categories(self):
+        return list(self._categories)
+
+    def has(self, category, item):
+        return item.lower() in self._categories.get(category, {})
+
+    def add(self, category, item):
+        """Add `item` to `category`; returns False if it was already there"""
+        lower = item.lower()
+        names = self._categories.setdefault(category, {})
+        if lower in names:
+            return False
+        self.inventory.setdefault(category, []).append(item)
+        names[lower] = item
+        bisect.insort(self._category_sorted.setdefault(category, []), lower)
+        if self._ref(lower, item):
+            bisect.insort(self._sorted, lower)
+            if self._index is not None:
+                self._index.add(item)
+        self.version += 1
+        return True
+
+    def remove(self, category, item):
+        """Remove `item` from `category`; returns False if it was not there"""
+        lower = item.lower()
+        names = self._categories.get(category, {})
+        if lower not in names:
+            return False
+        del names[lower]
+        self.inventory[category] = [i for i in self.inventory[category] if i.lower() != lower]
+        keys = self._category_sorted[category]
+        del keys[bisect.bisect_left(keys, lower)]
+        self._refs[lower] -= 1
+        if not self._refs[lower]:
+            del self._refs[lower]
+            del self._names[lower]
+            del self._sorted[bisect.bisect_left(self._sorted, lower)]
+            self._index = None  # the index only grows; rebuild on next search
+        self.version += 1
+        return True
+
+    def category(self, category):
+        """Sorted names in one category"""
+        return self._cached(("category", category), lambda: [
+            self._categories[category][lower] for lower in self._category_sorted.get(category, [])
+        ])
+
+    def view(self, extras=()):
+        """Sorted, de-duplicated names across all categories plus `extras`"""
+        extras = tuple(extras)
+        if not extras:
+            return self._cached(("all",), lambda: [self._names[lower] for lower in self._sorted])
+
+        def build():
+            merged = dict(zip(self._sorted, (self._names[lower] for lower in self._sorted)))
+            for item in extras:
+                merged.setdefault(item.lower(), item)
+            return [merged[lower] for lower in sorted(merged)]
+        return self._cached(("all", extras), build)
+
+    def index(self, extras=()):
+        """IngredientIndex over view(extras)"""
+        extras = tuple(extras)
+        if not extras:
+            if self._index is None:
+                self._index = IngredientIndex(self.view())
+            return self._index
+        return self._cached(("index", extras), lambda: IngredientIndex(self.view(extras)))
+
+    def _cached(self, key, build):
+        cached = self._views.get(key)
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, build())
+            self._views[key] = cached
+        return cached[1]
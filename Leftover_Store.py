@@ -0,0 +1,84 @@
+import bisect
+import itertools
+
+
+class LeftoverStore:
+    """Indexed view over a user's `leftover_ingredients` list.
+
+    The list stays the JSON-compatible source of truth and is updated in
+    place, so saving the user works as before. On top of it the store keeps
+    items by name, type and storage for O(1) lookups, and an expiry-ordered
+    index maintained with bisect for O(log n) ordered iteration.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self._seq = itertools.count()
+        self._rebuild()
+
+    def _rebuild(self):
+        self._by_name = {}
+        self._by_type = {}
+        self._by_storage = {}
+        self._expiry = []
+        self._by_seq = {}
+        for item in self.items:
+            self._index(item)
+
+    def _index(self, item):
+        seq = next(self._seq)
+        self._by_seq[seq] = item
+        self._by_name.setdefault(item['name'], []).append(item)
+        self._by_type.setdefault(item.get('type'), []).append(item)
+        self._by_storage.setdefault(item.get('storage'), []).append(item)
+        bisect.insort(self._expiry, (item.get('expiry_date') or "", seq))
+
+    def tracks(self, items):
+        """True while `items` is still the list this store indexes, unchanged from outside"""
+        return items is self.items and len(items) == len(self._by_seq)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def names(self):
+        return [item['name'] for item in self.items]
+
+    def get(self, name):
+        """The first leftover called `name`, or None"""
+        items = self._by_name.get(name)
+        return items[0] if items else None
+
+    def add(self, item):
+        self.items.append(item)
+        self._index(item)
+
+    def remove_many(self, names):
+        """Remove every leftover whose name is in `names` in a single pass"""
+        names = set(names)
+        kept = [item for item in self.items if item['name'] not in names]
+        removed = len(self.items) - len(kept)
+        if removed:
+            self.items[:] = kept
+            self._rebuild()
+        return removed
+
+    def filter(self, types=None, storages=None):
+        """Leftovers of any of `types` and stored any of `storages` (None means all)"""
+        if not types and not storages:
+            return list(self.items)
+        if types:
+            candidates = [item for t in types for item in self._by_type.get(t, ())]
+            if storages:
+                storages = set(storages)
+                candidates = [item for item in candidates if item.get('storage') in storages]
+        else:
+            candidates = [item for s in storages for item in self._by_storage.get(s, ())]
+        return candidates
+
+    def by_expiry(self, before=None):
+        """Leftovers ordered by expiry date, optionally only those expiring before `before` (YYYY-MM-DD)"""
+        end = bisect.bisect_left(self._expiry, (before, -1)) if before is not None else len(self._expiry)
+        return [self._by_seq[seq] for _, seq in self._expiry[:end]]
@@ -0,0 +1,185 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from User_Data import _file_lock
+
+# Columns of the nutrient matrix, all per 100 g of the ingredient
+NUTRIENTS = ["calories", "protein_g", "carbohydrates_total_g", "fat_total_g", "fiber_g", "sugar_g"]
+
+# Approximate per-100 g values for the ingredients the apps offer out of the box
+DEFAULT_NUTRIENTS = {
+    "spinach": (23, 2.9, 3.6, 0.4, 2.2, 0.4),
+    "kale": (49, 4.3, 8.8, 0.9, 3.6, 2.3),
+    "carrots": (41, 0.9, 9.6, 0.2, 2.8, 4.7),
+    "bell peppers": (31, 1.0, 6.0, 0.3, 2.1, 4.2),
+    "cucumber": (15, 0.7, 3.6, 0.1, 0.5, 1.7),
+    "tomatoes": (18, 0.9, 3.9, 0.2, 1.2, 2.6),
+    "onion": (40, 1.1, 9.3, 0.1, 1.7, 4.2),
+    "garlic": (149, 6.4, 33.1, 0.5, 2.1, 1.0),
+    "chicken breast": (165, 31.0, 0.0, 3.6, 0.0, 0.0),
+    "salmon": (208, 20.0, 0.0, 13.4, 0.0, 0.0),
+    "tofu": (76, 8.0, 1.9, 4.8, 0.3, 0.6),
+    "eggs": (143, 12.6, 0.7, 9.5, 0.0, 0.4),
+    "chickpeas": (164, 8.9, 27.4, 2.6, 7.6, 4.8),
+    "paneer": (321, 21.4, 3.6, 25.0, 0.0, 2.6),
+    "lamb": (294, 24.5, 0.0, 20.9, 0.0, 0.0),
+    "quinoa": (120, 4.4, 21.3, 1.9, 2.8, 0.9),
+    "brown rice": (123, 2.7, 25.6, 1.0, 1.6, 0.2),
+    "rice": (130, 2.7, 28.2, 0.3, 0.4, 0.1),
+    "bread": (265, 9.0, 49.0, 3.2, 2.7, 5.0),
+    "oats": (389, 16.9, 66.3, 6.9, 10.6, 0.9),
+    "pasta": (131, 5.0, 25.0, 1.1, 1.8, 0.6),
+    "noodles": (138, 4.5, 25.2, 2.1, 1.2, 0.4),
+    "apples": (52, 0.3, 13.8, 0.2, 2.4, 10.4),
+    "bananas": (89, 1.1, 22.8, 0.3, 2.6, 12.2),
+    "berries": (57, 0.7, 14.5, 0.3, 2.4, 10.0),
+    "mango": (60, 0.8, 15.0, 0.4, 1.6, 13.7),
+    "avocado": (160, 2.0, 8.5, 14.7, 6.7, 0.7),
+    "lemon": (29, 1.1, 9.3, 0.3, 2.8, 2.5),
+    "orange": (47, 0.9, 11.8, 0.1, 2.4, 9.4),
+    "milk": (61, 3.2, 4.8, 3.3, 0.0, 5.1),
+    "butter": (717, 0.9, 0.1, 81.1, 0.0, 0.1),
+    "cheese": (402, 24.9, 1.3, 33.1, 0.0, 0.5),
+    "yogurt": (61, 3.5, 4.7, 3.3, 0.0, 4.7),
+    "cream": (340, 2.8, 2.7, 36.1, 0.0, 2.9),
+    "potato": (77, 2.0, 17.5, 0.1, 2.2, 0.8),
+    "sugar": (387, 0.0, 100.0, 0.0, 0.0, 100.0),
+    "flour": (364, 10.3, 76.3, 1.0, 2.7, 0.3),
+    "honey": (304, 0.3, 82.4, 0.0, 0.2, 82.1),
+}
+
+
+def per_100g(item):
+    """Nutrient row per 100 g from an API Ninjas nutrition item.
+
+    Fields the API withholds (it sends a text notice instead of a number on
+    some plans) become NaN.
+    """
+    serving = item.get("serving_size_g")
+    try:
+        scale = 100.0 / float(serving)
+    except (TypeError, ValueError, ZeroDivisionError):
+        scale = 1.0  # API Ninjas defaults to a 100 g serving
+    row = []
+    for nutrient in NUTRIENTS:
+        try:
+            row.append(float(item.get(nutrient)) * scale)
+        except (TypeError, ValueError):
+            row.append(np.nan)
+    return row
+
+
+class NutrientTable:
+    """On-disk table of per-100 g nutrient values.
+
+    Values are one float matrix in `<path>.npy`, opened memory-mapped so
+    lookups never load the whole table, and the row of each ingredient is
+    kept in `<path>.json`. The table is seeded with DEFAULT_NUTRIENTS and
+    grows as missing ingredients are fetched.
+
+    One table is shared by every session, so the names and the matrix they
+    index are published together as one tuple that readers take once.
+    Writers hold a file lock, as other server processes may share the files.
+    """
+
+    def __init__(self, path="nutrients", seed=DEFAULT_NUTRIENTS):
+        self.matrix_path = path + ".npy"
+        self.names_path = path + ".json"
+        with _file_lock(self.names_path):
+            if not (os.path.exists(self.matrix_path) and os.path.exists(self.names_path)):
+                names = list(seed)
+                self._write(names, np.array([seed[n] for n in names], dtype=np.float64).reshape(-1, len(NUTRIENTS)))
+        self._load()
+
+    def _load(self):
+        with open(self.names_path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        matrix = np.load(self.matrix_path, mmap_mode='r')
+        self._table = (names, matrix)
+
+    def _write(self, names, matrix):
+        """Replace both files atomically (matrix first, then the names that index it)"""
+        tmp = f"{self.matrix_path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp, self.matrix_path)
+        tmp = f"{self.names_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({name: i for i, name in enumerate(names)}, f)
+        os.replace(tmp, self.names_path)
+
+    def __len__(self):
+        return len(self._table[0])
+
+    def __contains__(self, name):
+        return name.strip().lower() in self._table[0]
+
+    def missing(self, names):
+        """The names (de-duplicated, case-insensitively) that have no row yet"""
+        known = self._table[0]
+        seen = {}
+        for name in names:
+            key = name.strip().lower()
+            if key not in known:
+                seen.setdefault(key, name)
+        return list(seen.values())
+
+    def rows(self, names):
+        """Nutrient matrix for `names`, one row each; unknown names are NaN rows"""
+        known_names, matrix = self._table
+        index = np.array([known_names.get(n.strip().lower(), -1) for n in names], dtype=np.intp)
+        values = np.full((len(index), len(NUTRIENTS)), np.nan)
+        known = index >= 0
+        if known.any():
+            values[known] = matrix[index[known]]
+        return values
+
+    def lookup(self, names):
+        """DataFrame of per-100 g nutrients indexed by the given names"""
+        return pd.DataFrame(self.rows(names), index=list(names), columns=NUTRIENTS)
+
+    def totals(self, names, grams, servings=1):
+        """Per-serving nutrient totals for `grams` of each of `names`.
+
+        Computed as one matrix product, (grams / 100) @ rows / servings.
+        Values missing from the table (whole unknown names, or single
+        nutrients the API withheld) count as zero; they are also returned as
+        {name: [nutrients without data]} so the caller can flag the
+        estimate as partial.
+        """
+        rows = self.rows(names)
+        gaps = np.isnan(rows)
+        missing = {
+            name: [nutrient for nutrient, gap in zip(NUTRIENTS, row_gaps) if gap]
+            for name, row_gaps in zip(names, gaps) if row_gaps.any()
+        }
+        weights = np.asarray(grams, dtype=np.float64) / 100.0
+        per_serving = weights @ np.nan_to_num(rows) / max(servings, 1)
+        return pd.Series(per_serving, index=NUTRIENTS), missing
+
+    def add_many(self, rows):
+        """Store rows ({name: per-100 g values}); existing names are overwritten"""
+        if not rows:
+            return
+        with _file_lock(self.names_path):
+            self._load()  # another process may have grown the table meanwhile
+            known, stored = self._table
+            names = [None] * len(known)
+            for name, i in known.items():
+                names[i] = name
+            matrix = np.array(stored, dtype=np.float64).reshape(-1, len(NUTRIENTS))
+            updates = {}
+            for name, values in rows.items():
+                key = name.strip().lower()
+                if key in known:
+                    matrix[known[key]] = values
+                else:
+                    updates[key] = values
+            if updates:
+                names.extend(updates)
+                matrix = np.vstack([matrix, np.array(list(updates.values()), dtype=np.float64)])
+            self._write(names, matrix)
+            self._load()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace and case so trivially different prompts share an entry"""
+    return " ".join(prompt.split()).casefold()
+
+
+class ResponseCache:
+    """Persistent, size-bounded cache of generated text keyed by content hash.
+
+    Entries expire after `ttl_seconds`; once more than `max_entries` are
+    stored the least recently used ones are evicted. Hit and miss counts are
+    kept for the lifetime of the process.
+    """
+
+    def __init__(self, db_path="recipe_cache.db", ttl_seconds=7 * 24 * 3600, max_entries=1000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Shared by every session/thread in the process, guarded by our own lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)"
+            )
+
+    @staticmethod
+    def make_key(*parts, prompt=None):
+        """Hash of the identifying parts (model name, config, ...) and the normalized prompt"""
+        material = list(parts)
+        if prompt is not None:
+            material.append(normalize_prompt(prompt))
+        encoded = json.dumps(material, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key):
+        """Cached value for `key`, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used)"
+                " VALUES (?, ?, ?, ?)", (key, value, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / total * 100) if total else 0,
+            'entries': entries,
+        }
@@ -1,53 +1,1219 @@
+import atexit
+import bisect
+import copy
+import gzip
+import itertools
 import json
+import logging
 import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import MutableMapping
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import quote
+
+from Activity_Log import empty_activity_log
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to locking within this process only
+    fcntl = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+_MISSING = object()
+
+
+def _json_bytes(data, **dump_kwargs):
+    return json.dumps(data, **dump_kwargs).encode('utf-8')
+
+
+def _min_json_bytes(data, **dump_kwargs):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def _msgpack_bytes(data, **dump_kwargs):
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def _msgpack_load(raw):
+    return msgpack.unpackb(raw, raw=False)
+
+
+def _zstd(encode):
+    return lambda data, **dump_kwargs: zstandard.ZstdCompressor(level=10).compress(encode(data))
+
+
+def _unzstd(decode):
+    return lambda raw: decode(zstandard.ZstdDecompressor().decompressobj().decompress(raw))
+
+
+def _gzip_bytes(data, **dump_kwargs):
+    return gzip.compress(_min_json_bytes(data), compresslevel=6, mtime=0)
+
+
+def _gzip_load(raw):
+    return json.loads(gzip.decompress(raw))
+
+
+# File suffix -> (encode, decode, optional packages it needs); the longest
+# matching suffix wins and anything else is read and written as pretty JSON
+FILE_FORMATS = {
+    '.min.json': (_min_json_bytes, json.loads, ()),
+    '.json.gz': (_gzip_bytes, _gzip_load, ()),
+    '.json.zst': (_zstd(_min_json_bytes), _unzstd(json.loads), ('zstandard',)),
+    '.msgpack': (_msgpack_bytes, _msgpack_load, ('msgpack',)),
+    '.msgpack.zst': (_zstd(_msgpack_bytes), _unzstd(_msgpack_load), ('msgpack', 'zstandard')),
+}
+
+# What a truncated or garbled file raises while being decoded. Only decoding
+# errors: a file that can't be read at all must fail the caller, not look empty
+_CORRUPT_ERRORS = (ValueError, EOFError, gzip.BadGzipFile, zlib.error)
+if zstandard is not None:
+    _CORRUPT_ERRORS += (zstandard.ZstdError,)
+if msgpack is not None:
+    _CORRUPT_ERRORS += (msgpack.UnpackException,)
+
+
+def _split_format(file_path):
+    """(path without its format suffix, suffix); plain JSON files keep '.json'"""
+    for suffix in sorted(FILE_FORMATS, key=len, reverse=True):
+        if file_path.endswith(suffix):
+            return file_path[:-len(suffix)], suffix
+    if file_path.endswith('.json'):
+        return file_path[:-len('.json')], '.json'
+    return file_path, ''
+
+
+def _codec(file_path):
+    suffix = _split_format(file_path)[1]
+    if suffix not in FILE_FORMATS:
+        return _json_bytes, json.loads
+    encode, decode, packages = FILE_FORMATS[suffix]
+    installed = {'msgpack': msgpack, 'zstandard': zstandard}
+    for package in packages:
+        if installed[package] is None:
+            raise ImportError(f"{suffix} files need the {package} package")
+    return encode, decode
+
+
+def _read_json(file_path):
+    """Read a user data file in the format its suffix names.
+
+    Returns an empty dict if the file is missing or corrupt.
+    """
+    decode = _codec(file_path)[1]
+    try:
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return {}
+    try:
+        data = decode(raw)
+    except _CORRUPT_ERRORS:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_json_atomic(file_path, data, **dump_kwargs):
+    """Write to a temp file and swap it in so readers never see half a file.
+
+    `dump_kwargs` only apply to plain JSON; the other formats are compact.
+    """
+    encode = _codec(file_path)[0]
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(encode(data, **dump_kwargs))
+    os.replace(tmp_path, file_path)
+
+
+@contextmanager
+def _file_lock(file_path):
+    """Hold an exclusive lock on `file_path` across threads and processes"""
+    with _process_locks_guard:
+        thread_lock = _process_locks.setdefault(file_path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{file_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _file_signature(file_path):
+    """Cheap fingerprint used to tell whether another writer touched a file"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _merge_record(base, ours, theirs):
+    """Three-way merge of one user record changed by this session and another.
+
+    Appended list items and point increments from both sides are kept; for
+    any other field changed on both sides this session's value wins. A dict
+    or list both sides created (or converted to) merges as if it had been
+    empty before.
+    """
+    if ours == base:
+        return theirs
+    if theirs == base:
+        return ours
+    if type(base) is not type(ours) and ours == theirs:
+        return ours
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        if not isinstance(base, dict):
+            base = {}
+        merged = {}
+        for key in list(theirs) + [key for key in ours if key not in theirs]:
+            value = _merge_record(base.get(key, _MISSING), ours.get(key, _MISSING),
+                                  theirs.get(key, _MISSING))
+            if value is not _MISSING:
+                merged[key] = value
+        return merged
+    if isinstance(ours, list) and isinstance(theirs, list):
+        if not isinstance(base, list):
+            base = []
+        if ours[:len(base)] == base and theirs[:len(base)] == base:
+            return theirs + ours[len(base):]
+    if _is_int(base) and _is_int(ours) and _is_int(theirs):
+        return theirs + (ours - base)
+    return ours
+
+
+def _replace_contents(target, source):
+    """Update a user dict in place so references held by the app stay valid"""
+    target.clear()
+    target.update(copy.deepcopy(source))
+
+
+def _diff_record(path, old, new, ops):
+    """Append the delta ops that turn `old` into `new` to `ops`"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                ops.append({'op': 'set', 'path': path + [key], 'value': value})
+            else:
+                _diff_record(path + [key], old[key], value, ops)
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'del', 'path': path + [key]})
+    elif isinstance(old, list) and isinstance(new, list) and \
+            len(new) >= len(old) and new[:len(old)] == old:
+        # Lists in a user record are almost always appended to
+        if len(new) > len(old):
+            ops.append({'op': 'extend', 'path': path, 'items': new[len(old):]})
+    elif _is_int(old) and _is_int(new):
+        if new != old:
+            ops.append({'op': 'incr', 'path': path, 'by': new - old})
+    elif old != new:
+        ops.append({'op': 'set', 'path': path, 'value': new})
+
+
+def _apply_op(users, op):
+    """Apply one delta op from the write-ahead log to `users`"""
+    path = [op['user']] + op['path']
+    parent = users
+    for key in path[:-1]:
+        parent = parent.setdefault(key, {})
+    key = path[-1]
+    if op['op'] == 'set':
+        parent[key] = op['value']
+    elif op['op'] == 'del':
+        parent.pop(key, None)
+    elif op['op'] == 'extend':
+        parent.setdefault(key, []).extend(op['items'])
+    elif op['op'] == 'incr':
+        parent[key] = parent.get(key, 0) + op['by']
+
+
+class JsonStorage:
+    """Keep every user in a single file, pretty-printed JSON by default.
+
+    The file suffix picks a more compact format instead (see FILE_FORMATS),
+    e.g. user_data.json.gz or user_data.msgpack.
+
+    Saves take a file lock, re-read the file if another session wrote it since
+    our last read, and merge per user so concurrent sessions don't drop each
+    other's points or recipes.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._base = {}  # each user as last read from / written to disk
+        self._signature = None
+
+    def load(self):
+        with _file_lock(self.file_path):
+            users = _read_json(self.file_path)
+            self._signature = _file_signature(self.file_path)
+        self._base = copy.deepcopy(users)
+        return users
+
+    def save(self, users, changed=None):
+        names = [name for name in (users.keys() if changed is None else changed) if name in users]
+        with _file_lock(self.file_path):
+            if _file_signature(self.file_path) == self._signature:
+                on_disk = dict(self._base)
+            else:
+                on_disk = self._absorb(users)
+            for name in names:
+                on_disk[name] = users[name]
+            _write_json_atomic(self.file_path, on_disk, indent=4)
+            self._signature = _file_signature(self.file_path)
+        for name in names:
+            self._base[name] = copy.deepcopy(users[name])
+
+    def refresh(self, users, username=None):
+        """Pick up other sessions' writes; a no-op unless the file changed.
+
+        A single JSON file can't be read per user, so this refreshes every
+        user at once, but only re-parses when another writer touched the file.
+        """
+        with _file_lock(self.file_path):
+            if _file_signature(self.file_path) != self._signature:
+                self._absorb(users)
+                self._signature = _file_signature(self.file_path)
+
+    def _absorb(self, users):
+        """Merge the file on disk into the in-memory users and return it"""
+        on_disk = _read_json(self.file_path)
+        for name, theirs in on_disk.items():
+            if name not in users:
+                users[name] = copy.deepcopy(theirs)
+            elif name in self._base:
+                merged = _merge_record(self._base[name], users[name], theirs)
+                if merged is not users[name]:
+                    _replace_contents(users[name], merged)
+            self._base[name] = copy.deepcopy(theirs)
+        return on_disk
+
+
+class WalStorage:
+    """Snapshot file plus an append-only log of compact per-user deltas.
+
+    Each save only appends the fields that changed since the last save, so
+    the cost of a write follows the size of the change rather than the size
+    of the whole user base. The log is folded back into the snapshot every
+    `compact_every` records. Point and list changes are logged as increments
+    and appends, so deltas from concurrent sessions compose instead of
+    overwriting each other.
+    """
+
+    def __init__(self, file_path, log_path=None, compact_every=500):
+        self.file_path = file_path
+        self.log_path = log_path or f"{file_path}.wal"
+        self.compact_every = compact_every
+        self._shadow = {}  # last persisted copy of each user, used for diffing
+        self._log_records = 0
+
+    def _snapshot_signature(self):
+        signature = _file_signature(self.file_path)
+        return list(signature) if signature else None
+
+    def _read_log(self):
+        """(snapshot signature from the log's header, the logged ops).
+
+        The signature is _MISSING for a log written before logs had headers.
+        """
+        base, ops = _MISSING, []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write at the tail of the log
+                    if op.get('op') == 'base':
+                        base = op['snapshot']
+                    else:
+                        ops.append(op)
+        return base, ops
+
+    def _log_base(self):
+        """Snapshot signature from the log's header without reading the rest of the log"""
+        try:
+            with open(self.log_path, 'r') as f:
+                op = json.loads(f.readline())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return _MISSING
+        return op['snapshot'] if op.get('op') == 'base' else _MISSING
+
+    def _start_log(self, ops=()):
+        """Swap in a log holding a header for the current snapshot followed by `ops`"""
+        header = {'op': 'base', 'snapshot': self._snapshot_signature()}
+        tmp_path = f"{self.log_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(json.dumps(op, separators=(',', ':')) + '\n' for op in [header, *ops]))
+        os.replace(tmp_path, self.log_path)
+
+    def _prepare_log(self):
+        """Make sure the log is headed by the current snapshot; called with the file lock held"""
+        base = self._log_base()
+        if base == self._snapshot_signature():
+            return
+        if base is _MISSING:
+            self._start_log(self._read_log()[1])
+        else:
+            # Left behind by a compaction that folded it into the snapshot
+            # and stopped before starting a new log
+            self._start_log()
+
+    def _replay(self):
+        """Rebuild the current state from the snapshot and the log on disk.
+
+        The log's header names the snapshot it continues. A compaction swaps
+        in the new snapshot before it restarts the log, so a log whose header
+        names another snapshot is already folded in and is not applied again.
+        """
+        users = _read_json(self.file_path)
+        base, ops = self._read_log()
+        if base is not _MISSING and base != self._snapshot_signature():
+            ops = []
+        for op in ops:
+            _apply_op(users, op)
+        return users, len(ops)
+
+    def load(self):
+        with _file_lock(self.file_path):
+            users, self._log_records = self._replay()
+        self._shadow = copy.deepcopy(users)
+        return users
+
+    def save(self, users, changed=None):
+        names = users.keys() if changed is None else changed
+        ops = []
+        for name in names:
+            if name not in users:
+                continue
+            user_ops = []
+            if name in self._shadow:
+                _diff_record([], self._shadow[name], users[name], user_ops)
+            else:
+                user_ops.append({'op': 'set', 'path': [], 'value': users[name]})
+            ops.extend({'user': name, **op} for op in user_ops)
+            self._shadow[name] = copy.deepcopy(users[name])
+
+        if not ops:
+            return
+        with _file_lock(self.file_path):
+            self._prepare_log()
+            with open(self.log_path, 'a') as f:
+                f.write(''.join(json.dumps(op, separators=(',', ':')) + '\n' for op in ops))
+            self._log_records += len(ops)
+            if self._log_records >= self.compact_every:
+                self._compact()
+
+    def compact(self):
+        """Fold the log into a fresh snapshot and start an empty log"""
+        with _file_lock(self.file_path):
+            self._compact()
+
+    def _compact(self):
+        # Rebuilt from disk rather than memory so other sessions' deltas survive
+        self._prepare_log()
+        users, _ = self._replay()
+        _write_json_atomic(self.file_path, users, indent=4)
+        self._start_log()
+        self._log_records = 0
+
+
+def _summarize(data):
+    """Leaderboard-relevant fields of a full user record"""
+    return {
+        'points': data.get('points', 0),
+        'achievements': len(data.get('achievements', [])),
+        'quiz_stats': data.get('quiz_stats', {}),
+    }
+
+
+class LazyUsers(MutableMapping):
+    """Dict of users that only reads a user's full record on first access"""
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._names = dict.fromkeys(storage.usernames())
+        self._loaded = {}
+
+    def __getitem__(self, username):
+        if username not in self._loaded:
+            if username not in self._names:
+                raise KeyError(username)
+            self._loaded[username] = self._storage.load_user(username)
+        return self._loaded[username]
+
+    def __setitem__(self, username, data):
+        self._names[username] = None
+        self._loaded[username] = data
+
+    def __delitem__(self, username):
+        del self._names[username]
+        self._loaded.pop(username, None)
+
+    def __contains__(self, username):
+        return username in self._names
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+    def loaded(self):
+        """Users whose full record is currently in memory"""
+        return self._loaded
+
+    def register(self, username):
+        """Make a user created elsewhere visible without loading it"""
+        self._names.setdefault(username, None)
+
+    def password(self, username):
+        """A user's password, read from the storage index when not loaded"""
+        if username in self._loaded:
+            return self._loaded[username].get('password')
+        return self._storage.password_for(username)
+
+    def summaries(self):
+        """Leaderboard fields for every user, without loading the unloaded ones"""
+        result = self._storage.summaries()
+        for username, data in self._loaded.items():
+            result[username] = _summarize(data)
+        return result
+
+
+class SqliteStorage:
+    """One row per user plus indexed child tables for the large per-user lists.
+
+    Loading a user only reads that user's rows, so the recipe text of every
+    other user is never parsed. Each user row carries a version number that
+    is checked on write (optimistic locking); on a conflict the other
+    session's copy is re-read and merged, so writers never hold a lock for
+    longer than their own transaction.
+    """
+
+    # list field -> columns copied out of each item for indexing/querying
+    CHILD_TABLES = {
+        'created_recipes': ('name', 'type', 'date'),
+        'leftover_ingredients': ('name', 'type', 'expiry_date'),
+        'achievements': ('name', 'earned_on'),
+    }
+
+    # Child tables of older versions; rows listed in a user's child_fields are
+    # still read from them and are cleared once that user is written again.
+    # activity_log is stored in columns now and kept inline in `extra`.
+    LEGACY_CHILD_TABLES = ('activity_log',)
+
+    def __init__(self, db_path):
+        # Let the default "user_data.json" path map onto "user_data.db"
+        stem, suffix = _split_format(db_path)
+        if suffix:
+            db_path = stem + '.db'
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._base = {}  # each loaded user as last read from / written to the db
+        self._versions = {}
+        # Streamlit runs every rerun on a fresh thread, so the connection is
+        # shared across threads and guarded by our own lock instead
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                " username TEXT PRIMARY KEY,"
+                " password TEXT NOT NULL,"
+                " points INTEGER NOT NULL DEFAULT 0,"
+                " total_attempts INTEGER NOT NULL DEFAULT 0,"
+                " correct_answers INTEGER NOT NULL DEFAULT 0,"
+                " child_fields TEXT NOT NULL DEFAULT '',"
+                " extra TEXT NOT NULL DEFAULT '{}',"
+                " version INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(users)")]
+            if 'version' not in columns:
+                self._conn.execute(
+                    "ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_users_points ON users (points DESC)"
+            )
+            for table, columns in self.CHILD_TABLES.items():
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    " username TEXT NOT NULL,"
+                    " seq INTEGER NOT NULL,"
+                    + "".join(f" {column}," for column in columns) +
+                    " data TEXT NOT NULL,"
+                    " PRIMARY KEY (username, seq))"
+                )
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_{columns[0]}"
+                    f" ON {table} (username, {columns[0]})"
+                )
+            existing = {row[0] for row in self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self._legacy_tables = [t for t in self.LEGACY_CHILD_TABLES if t in existing]
+
+    def load(self):
+        return LazyUsers(self)
+
+    def usernames(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT username FROM users ORDER BY rowid").fetchall()
+        return [row[0] for row in rows]
+
+    def password_for(self, username):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT password FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_user(self, username):
+        with self._lock:
+            data, version = self._read_user(username)
+        if data is not None:
+            self._base[username] = copy.deepcopy(data)
+            self._versions[username] = version
+        return data
+
+    def refresh(self, users, username=None):
+        """Re-read users whose row was changed by another session since we read it"""
+        if username is None:
+            names = list(users.loaded()) if isinstance(users, LazyUsers) else list(users)
+        else:
+            names = [username]
+        with self._lock:
+            for name in names:
+                row = self._conn.execute(
+                    "SELECT version FROM users WHERE username = ?", (name,)
+                ).fetchone()
+                if row is None:
+                    continue
+                if name not in users:
+                    users[name], self._versions[name] = self._read_user(name)
+                    self._base[name] = copy.deepcopy(users[name])
+                    continue
+                if isinstance(users, LazyUsers) and name not in users.loaded():
+                    continue  # will be read fresh on first access anyway
+                if row[0] == self._versions.get(name):
+                    continue
+                theirs, version = self._read_user(name)
+                merged = _merge_record(self._base.get(name, theirs), users[name], theirs)
+                if merged is not users[name]:
+                    _replace_contents(users[name], merged)
+                self._base[name] = theirs
+                self._versions[name] = version
+
+    def _read_user(self, username):
+        row = self._conn.execute(
+            "SELECT password, points, total_attempts, correct_answers, child_fields, extra, version"
+            " FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        password, points, total_attempts, correct_answers, child_fields, extra, version = row
+        data = {
+            'password': password,
+            'points': points,
+            'quiz_stats': {'total_attempts': total_attempts, 'correct_answers': correct_answers},
+        }
+        data.update(json.loads(extra))
+        for table in filter(None, child_fields.split(',')):
+            items = self._conn.execute(
+                f"SELECT data FROM {table} WHERE username = ? ORDER BY seq", (username,)
+            ).fetchall()
+            data[table] = [json.loads(item[0]) for item in items]
+        return data, version
+
+    def summaries(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT u.username, u.points, u.total_attempts, u.correct_answers,"
+                " (SELECT COUNT(*) FROM achievements a WHERE a.username = u.username)"
+                " FROM users u"
+            ).fetchall()
+        return {
+            username: {
+                'points': points,
+                'achievements': achievements,
+                'quiz_stats': {'total_attempts': total_attempts, 'correct_answers': correct_answers},
+            }
+            for username, points, total_attempts, correct_answers, achievements in rows
+        }
+
+    def save(self, users, changed=None):
+        if changed is None:
+            changed = users.loaded().keys() if isinstance(users, LazyUsers) else users.keys()
+        with self._lock:
+            for username in changed:
+                if username in users:
+                    self._save_user(username, users[username])
+
+    def _save_user(self, username, data):
+        """Write one user, merging with any version written by another session"""
+        while True:
+            expected = self._versions.get(username)
+            with self._conn:
+                if self._write_user(username, data, expected):
+                    break
+            theirs, version = self._read_user(username)
+            if theirs is not None and username in self._base:
+                merged = _merge_record(self._base[username], data, theirs)
+                if merged is not data:
+                    _replace_contents(data, merged)
+            self._versions[username] = version
+            if theirs is not None:
+                self._base[username] = theirs
+        self._versions[username] = 0 if expected is None else expected + 1
+        self._base[username] = copy.deepcopy(data)
+
+    def _write_user(self, username, data, expected_version):
+        """Write one user row and its children; False if the version moved on"""
+        quiz_stats = data.get('quiz_stats', {})
+        # Only lists go to child tables; anything else stays inline in `extra`
+        child_fields = [
+            key for key in self.CHILD_TABLES if isinstance(data.get(key), list)
+        ]
+        extra = {
+            key: value for key, value in data.items()
+            if key not in ('password', 'points', 'quiz_stats') and key not in child_fields
+        }
+        values = (data.get('password', ''), data.get('points', 0),
+                  quiz_stats.get('total_attempts', 0), quiz_stats.get('correct_answers', 0),
+                  ','.join(child_fields), json.dumps(extra))
+        if expected_version is None:
+            cursor = self._conn.execute(
+                "INSERT INTO users (password, points, total_attempts, correct_answers,"
+                " child_fields, extra, username, version) VALUES (?, ?, ?, ?, ?, ?, ?, 0)"
+                " ON CONFLICT (username) DO NOTHING",
+                values + (username,)
+            )
+        else:
+            cursor = self._conn.execute(
+                "UPDATE users SET password = ?, points = ?, total_attempts = ?,"
+                " correct_answers = ?, child_fields = ?, extra = ?, version = version + 1"
+                " WHERE username = ? AND version = ?",
+                values + (username, expected_version)
+            )
+        if cursor.rowcount == 0:
+            return False
+        for table in self._legacy_tables:
+            self._conn.execute(f"DELETE FROM {table} WHERE username = ?", (username,))
+        for table, columns in self.CHILD_TABLES.items():
+            self._conn.execute(f"DELETE FROM {table} WHERE username = ?", (username,))
+            items = data.get(table)
+            if not isinstance(items, list):
+                continue
+            placeholders = ", ".join("?" * (len(columns) + 3))
+            self._conn.executemany(
+                f"INSERT INTO {table} (username, seq, {', '.join(columns)}, data)"
+                f" VALUES ({placeholders})",
+                [
+                    (username, seq, *(item.get(column) if isinstance(item, dict) else None
+                                      for column in columns), json.dumps(item))
+                    for seq, item in enumerate(items)
+                ]
+            )
+        return True
+
+
+class ShardedStorage:
+    """One JSON file per user plus a small index of names, passwords and scores.
+
+    Logins and the leaderboard only read the index; a user's full profile
+    (recipes and all) is read from its own file the first time it is needed,
+    so startup time and memory don't grow with the number of registered users.
+    """
+
+    def __init__(self, directory):
+        # Let the default "user_data.json" path map onto a "user_data/" folder;
+        # each user's file uses the format of the given suffix
+        directory, suffix = _split_format(directory)
+        self.directory = directory
+        self.suffix = suffix or '.json'
+        self.index_path = os.path.join(directory, 'index.json')
+        os.makedirs(os.path.join(directory, 'users'), exist_ok=True)
+        self._shards = {}  # username -> JsonStorage for that user's own file
+        self._index = {}
+
+    def _shard(self, username):
+        if username not in self._shards:
+            file_name = f"u_{quote(username, safe='')}{self.suffix}"
+            self._shards[username] = JsonStorage(os.path.join(self.directory, 'users', file_name))
+        return self._shards[username]
+
+    def _read_index(self):
+        with _file_lock(self.index_path):
+            self._index = _read_json(self.index_path)
+        return self._index
+
+    def load(self):
+        self._read_index()
+        return LazyUsers(self)
+
+    def usernames(self):
+        return list(self._index)
+
+    def load_user(self, username):
+        return self._shard(username).load().get(username)
+
+    def password_for(self, username):
+        return self._index.get(username, {}).get('password')
+
+    def summaries(self):
+        return {
+            username: {
+                'points': entry.get('points', 0),
+                'achievements': entry.get('achievements', 0),
+                'quiz_stats': entry.get('quiz_stats', {}),
+            }
+            for username, entry in self._index.items()
+        }
+
+    def save(self, users, changed=None):
+        if changed is None:
+            changed = users.loaded().keys() if isinstance(users, LazyUsers) else users.keys()
+        entries = {}
+        for username in [name for name in changed if name in users]:
+            self._shard(username).save(users, [username])
+            entries[username] = {'password': users[username].get('password'), **_summarize(users[username])}
+        if not entries:
+            return
+        with _file_lock(self.index_path):
+            # Re-read so entries written by other sessions are kept
+            index = _read_json(self.index_path)
+            index.update(entries)
+            _write_json_atomic(self.index_path, index, separators=(',', ':'))
+            self._index = index
+
+    def refresh(self, users, username=None):
+        """Pick up users created elsewhere and re-read a changed user's file"""
+        for name in self._read_index():
+            if isinstance(users, LazyUsers):
+                users.register(name)
+        loaded = users.loaded() if isinstance(users, LazyUsers) else users
+        names = list(loaded) if username is None else [username]
+        for name in names:
+            if name in loaded:
+                self._shard(name).refresh(users, name)
+
+
+def migrate_json_to_sqlite(json_path="user_data.json", db_path="user_data.db"):
+    """One-shot copy of an existing user_data.json into a SQLite database"""
+    users = _read_json(json_path)
+    SqliteStorage(db_path).save(users)
+    return len(users)
+
+
+def migrate_json_to_shards(json_path="user_data.json", directory="user_data"):
+    """One-shot split of an existing user_data.json into per-user files"""
+    users = _read_json(json_path)
+    ShardedStorage(directory).save(users)
+    return len(users)
+
+
+def _time_file(file_path, users, repeat):
+    """Best-of-`repeat` save and load times (ms) of `users` in `file_path`'s format"""
+    save = load = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _write_json_atomic(file_path, users, indent=4)
+        save = min(save, time.perf_counter() - start)
+        start = time.perf_counter()
+        _read_json(file_path)
+        load = min(load, time.perf_counter() - start)
+    return {'bytes': os.path.getsize(file_path), 'save_ms': save * 1000, 'load_ms': load * 1000}
+
+
+def convert_user_data(source="user_data.json", target="user_data.json.gz", repeat=5):
+    """Rewrite a user data file in the format named by `target`'s suffix.
+
+    Returns the size and best save/load times of both formats so they can be
+    compared. The source is timed on a scratch copy and left untouched.
+    """
+    users = _read_json(source)
+    stem, suffix = _split_format(source)
+    scratch = f"{stem}.{os.getpid()}.timing{suffix}"
+    try:
+        before = _time_file(scratch, users, repeat)
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+    with _file_lock(target):
+        after = _time_file(target, users, repeat)
+    if _read_json(target) != users:
+        raise ValueError(f"{target} does not round-trip the data in {source}")
+    before['bytes'] = os.path.getsize(source)
+    return {'users': len(users), 'source': before, 'target': after}
+
+
+class LeaderboardIndex:
+    """Leaderboard rows kept sorted by (points, achievements) as scores change.
+
+    Each update re-positions one user with a binary search instead of
+    re-sorting everyone, rank lookups are a binary search, and the top k rows
+    are a slice. Ties keep the order in which users were first seen, which
+    matches the stable sort the leaderboard used before.
+    """
+
+    def __init__(self, rows=()):
+        self._seq = itertools.count()
+        self._order = {}  # username -> tie-break sequence number
+        self._by_order = {}  # tie-break sequence number -> username
+        self._keys = {}   # username -> current sort key
+        self._rows = {}   # username -> leaderboard row
+        self._ranking = []
+        for row in rows:
+            self._add(row['username'])
+            self._keys[row['username']] = self._key(row)
+            self._rows[row['username']] = row
+        self._ranking = sorted(self._keys.values())
+
+    def _add(self, username):
+        order = next(self._seq)
+        self._order[username] = order
+        self._by_order[order] = username
+
+    def _key(self, row):
+        return (-row['points'], -row['achievements'], self._order[row['username']])
+
+    def update(self, row):
+        username = row['username']
+        if username not in self._order:
+            self._add(username)
+        key = self._key(row)
+        old_key = self._keys.get(username)
+        self._rows[username] = row
+        if old_key == key:
+            return
+        if old_key is not None:
+            del self._ranking[bisect.bisect_left(self._ranking, old_key)]
+        bisect.insort(self._ranking, key)
+        self._keys[username] = key
+
+    def rank(self, username):
+        """1-based position of a user, or 0 if they are not ranked"""
+        key = self._keys.get(username)
+        if key is None:
+            return 0
+        return bisect.bisect_left(self._ranking, key) + 1
+
+    def top(self, limit=None):
+        keys = self._ranking if limit is None else self._ranking[:limit]
+        return [self._rows[self._by_order[key[2]]] for key in keys]
+
+
+# Local writes update the leaderboard immediately; this bounds how stale it can
+# get with respect to writes made by other server processes
+LEADERBOARD_RESYNC_SECONDS = 30
+
+# A unit of work left open by a Streamlit run that never finished (and whose
+# session never reruns) is flushed by other activity after this long
+UNIT_OF_WORK_MAX_AGE_SECONDS = 10
+
+# Write-behind defaults: pending saves reach storage at most this many seconds
+# late (the data-loss window on a crash), or sooner once this many users are dirty
+FLUSH_INTERVAL_SECONDS = 2.0
+MAX_DIRTY_USERS = 50
+
+STORAGE_BACKENDS = {
+    'json': JsonStorage,
+    'wal': WalStorage,
+    'sqlite': SqliteStorage,
+    'sharded': ShardedStorage,
+}
+
+
+class _UnitOfWork:
+    """Saves deferred on one thread (or one Streamlit session) until commit"""
+
+    def __init__(self, key):
+        self.key = key
+        self.depth = 1
+        self.dirty = set()  # None means every user
+        self.opened = time.monotonic()
+
+    def mark(self, changed):
+        if changed is None:
+            self.dirty = None
+        elif self.dirty is not None:
+            self.dirty.update(changed)
+
 
 class UserDataManager:
-    def __init__(self, file_path="user_data.json"):
+    def __init__(self, file_path="user_data.json", storage=None, write_behind=None,
+                 flush_interval=None, max_dirty=MAX_DIRTY_USERS):
         self.file_path = file_path
+        if storage is None:
+            storage = os.environ.get("PLATEPALS_STORAGE", "json")
+        if write_behind is None:
+            write_behind = os.environ.get("PLATEPALS_WRITE_BEHIND", "") == "1"
+        if flush_interval is None:
+            flush_interval = float(os.environ.get("PLATEPALS_FLUSH_INTERVAL", FLUSH_INTERVAL_SECONDS))
+        if isinstance(storage, str):
+            storage = STORAGE_BACKENDS[storage](file_path)
+        self.storage = storage
+        # One manager may be shared by every Streamlit session in the process
+        self._lock = threading.RLock()
         self.users = self._load_users()
+        self._leaderboard = None
+        self._leaderboard_built = 0.0
+        self._local = threading.local()
+        self._units = {}
+        # Saves requested vs. writes that actually reached storage
+        self.saves = 0
+        self.writes = 0
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self._pending = set()  # None means every user
+        self._flush_wanted = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self.flush_errors = 0
+        self._closed = False
+        if write_behind:
+            threading.Thread(target=self._flush_loop, name="user-data-flusher", daemon=True).start()
+            atexit.register(self.close)
 
     def _load_users(self):
-        """Load users from JSON file"""
-        if os.path.exists(self.file_path):
+        """Load users from storage"""
+        return self.storage.load()
+
+    def _save_users(self, changed=None):
+        """Save users to storage, optionally only the given usernames.
+
+        Inside a unit of work the write is deferred to commit(); the
+        in-memory data and the leaderboard are updated right away.
+        """
+        with self._lock:
+            self.saves += 1
+            unit = self._current_unit()
+            if unit is not None:
+                unit.mark(changed)
+            else:
+                self._write_users(changed)
+            if self._leaderboard is not None:
+                names = changed if changed is not None else (
+                    self.users.loaded() if isinstance(self.users, LazyUsers) else self.users)
+                for username in names:
+                    if username in self.users:
+                        self._leaderboard.update(
+                            self._leaderboard_row(username, _summarize(self.users[username])))
+
+    def _write_users(self, changed):
+        if not self.write_behind or self._closed:
+            self.storage.save(self.users, changed)
+            self.writes += 1
+            return
+        # Write-behind: only remember who is dirty; the flusher thread serializes
+        if changed is None:
+            self._pending = None
+        elif self._pending is not None:
+            self._pending.update(changed)
+        if self._pending is None or len(self._pending) >= self.max_dirty:
+            self._flush_wanted.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                self._flush_wanted.wait(self.flush_interval)
             try:
-                with open(self.file_path, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+                self._flush_pending()
+            except Exception:
+                self.flush_errors += 1
+                logger.exception("Write-behind flush of user data failed; the users stay pending")
 
-    def _save_users(self):
-        """Save users to JSON file"""
-        with open(self.file_path, 'w') as f:
-            json.dump(self.users, f, indent=4)
+    def _flush_pending(self):
+        """Write the pending users from a snapshot, without holding the manager lock.
+
+        Saves may merge in other sessions' changes; those are merged back
+        into the live records, which may have moved on in the meantime.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._closed:
+                    return  # close() wrote everything; saves now write through
+                pending, self._pending = self._pending, set()
+                if pending is None:
+                    pending = self.users.loaded() if isinstance(self.users, LazyUsers) else self.users
+                names = [name for name in pending if name in self.users]
+                if not names:
+                    return
+                before = {name: copy.deepcopy(self.users[name]) for name in names}
+            snapshot = copy.deepcopy(before)
+            try:
+                self.storage.save(snapshot, names)
+            except Exception:
+                with self._lock:
+                    if self._pending is not None:
+                        self._pending.update(names)
+                raise
+            with self._lock:
+                self.writes += 1
+                for name, theirs in snapshot.items():
+                    if name not in self.users:
+                        self.users[name] = theirs  # created elsewhere, read during the save
+                    elif name in before and theirs != before[name]:
+                        merged = _merge_record(before[name], self.users[name], theirs)
+                        if merged is not self.users[name]:
+                            _replace_contents(self.users[name], merged)
+
+    def flush(self):
+        """Write every pending write-behind save now"""
+        self._flush_pending()
+
+    def close(self):
+        """Flush pending saves and stop the flusher; later saves write through"""
+        with self._flush_lock, self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._flush_wanted.notify()
+            pending, self._pending = self._pending, set()
+            if pending is None or pending:
+                self._write_users(pending)
+
+    def _current_unit(self):
+        """This thread's open unit, unless a later run of its session took it over"""
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None and unit.key is not None and self._units.get(unit.key) is not unit:
+            self._local.unit = unit = None
+        return unit
+
+    def _flush(self, unit):
+        if unit.dirty is None or unit.dirty:
+            self._write_users(unit.dirty)
+            unit.dirty = set()
+
+    def begin(self, key=None):
+        """Defer this thread's saves until the matching commit().
+
+        Nested calls just deepen the current unit. A `key` (e.g. a Streamlit
+        session id) names a unit that outlives the script run that opened it:
+        if the previous run with that key was interrupted before committing,
+        its pending writes are flushed first.
+        """
+        with self._lock:
+            unit = self._current_unit()
+            if key is None and unit is not None:
+                unit.depth += 1
+                return
+            self._flush_stale_units()
+            for previous in (unit, self._units.get(key) if key is not None else None):
+                if previous is not None:
+                    self._units.pop(previous.key, None)
+                    self._flush(previous)
+            unit = _UnitOfWork(key)
+            if key is not None:
+                self._units[key] = unit
+            self._local.unit = unit
+
+    def commit(self):
+        """End the current unit of work, writing everything it touched at once"""
+        with self._lock:
+            unit = self._current_unit()
+            if unit is None:
+                return
+            unit.depth -= 1
+            if unit.depth > 0:
+                return
+            self._local.unit = None
+            if self._units.get(unit.key) is unit:
+                del self._units[unit.key]
+            self._flush(unit)
+
+    @contextmanager
+    def unit_of_work(self, key=None):
+        """Batch every save made inside the block into one write"""
+        self.begin(key)
+        try:
+            yield self
+        finally:
+            self.commit()
+
+    def _flush_stale_units(self):
+        now = time.monotonic()
+        for unit in self._units.values():
+            if now - unit.opened > UNIT_OF_WORK_MAX_AGE_SECONDS:
+                self._flush(unit)
+                unit.opened = now
+
+    def write_stats(self):
+        """How many saves were requested and how many storage writes they cost"""
+        with self._lock:
+            pending = len(self.users) if self._pending is None else len(self._pending)
+            return {'saves': self.saves, 'writes': self.writes, 'pending': pending}
+
+    def invalidate_user(self, username):
+        """Re-read one user if another process changed it since it was cached"""
+        refresh = getattr(self.storage, 'refresh', None)
+        if refresh is not None:
+            with self._lock:
+                refresh(self.users, username)
 
     def add_user(self, username, password):
-     if username in self.users:
-        return False, "Username already exists"
-
-     self.users[username] = {
-        'password': password,
-        'points': 0,
-        'quiz_stats': {'total_attempts': 0, 'correct_answers': 0},
-        'activity_log': [],
-        'created_recipes': [],
-        'completed_events': [],
-        'saved_menus': [],
-        'inventory': {},
-        'leftovers': [],
-        'leftover_ingredients': [],
-        'generated_recipes': [],
-        'friends': [],  # Initialize empty friends list
-        'achievements': []
-     }
-     self._save_users()
-     return True, "User created successfully"
+        with self._lock:
+            self.invalidate_user(username)
+            if username in self.users:
+                return False, "Username already exists"
+
+            self.users[username] = {
+                'password': password,
+                'points': 0,
+                'quiz_stats': {'total_attempts': 0, 'correct_answers': 0},
+                'activity_log': empty_activity_log(),
+                'created_recipes': [],
+                'completed_events': [],
+                'saved_menus': [],
+                'inventory': {},
+                'leftovers': [],
+                'leftover_ingredients': [],
+                'generated_recipes': [],
+                'friends': [],  # Initialize empty friends list
+                'achievements': []
+            }
+            self._save_users({username})
+        return True, "User created successfully"
 
     def verify_user(self, username, password):
         """Verify user credentials"""
+        self.invalidate_user(username)
         if username in self.users:
-            if self.users[username]['password'] == password:
+            if isinstance(self.users, LazyUsers):
+                stored = self.users.password(username)
+            else:
+                stored = self.users[username]['password']
+            if stored == password:
                 return True, "Login successful"
             return False, "Incorrect password"
         return False, "User not found"
@@ -58,37 +1224,95 @@ class UserDataManager:
 
     def update_user_data(self, username, data):
         """Update user data"""
-        if username in self.users:
-            self.users[username].update(data)
-            self._save_users()
-            return True, "User data updated"
+        with self._lock:
+            if username in self.users:
+                self.users[username].update(data)
+                self._save_users({username})
+                return True, "User data updated"
         return False, "User not found"
     
 
     def add_friend(self, user, friend):
         """Add friend to user's friend list"""
-        if user in self.users and friend in self.users:
-            if 'friends' not in self.users[user]:
-                self.users[user]['friends'] = []
-            if friend not in self.users[user]['friends']:
-                self.users[user]['friends'].append(friend)
-                self._save_users()
-                return True, f"Added {friend} as friend"
+        with self._lock:
+            if user in self.users and friend in self.users:
+                if 'friends' not in self.users[user]:
+                    self.users[user]['friends'] = []
+                if friend not in self.users[user]['friends']:
+                    self.users[user]['friends'].append(friend)
+                    self._save_users({user})
+                    return True, f"Added {friend} as friend"
         return False, "Failed to add friend"
 
-    def get_leaderboard(self):
-        """Get sorted leaderboard of all users"""
-        leaderboard = []
-        for username, data in self.users.items():
-            leaderboard.append({
-                'username': username,
-                'points': data.get('points', 0),
-                'achievements': len(data.get('achievements', [])),
-                'quiz_accuracy': self._calculate_accuracy(data.get('quiz_stats', {}))
-            })
-        return sorted(leaderboard, key=lambda x: (x['points'], x['achievements']), reverse=True)
+    def _user_summaries(self):
+        """Leaderboard fields for every user, reading as little as the storage allows"""
+        with self._lock:
+            if isinstance(self.users, LazyUsers):
+                return self.users.summaries()
+            return {username: _summarize(data) for username, data in self.users.items()}
+
+    def _leaderboard_row(self, username, summary):
+        return {
+            'username': username,
+            'points': summary['points'],
+            'achievements': summary['achievements'],
+            'quiz_accuracy': self._calculate_accuracy(summary['quiz_stats'])
+        }
+
+    def _leaderboard_index(self):
+        """The maintained leaderboard, resynced now and then for other processes' writes"""
+        with self._lock:
+            if self._leaderboard is None or \
+                    time.monotonic() - self._leaderboard_built > LEADERBOARD_RESYNC_SECONDS:
+                self._leaderboard = LeaderboardIndex(
+                    self._leaderboard_row(username, summary)
+                    for username, summary in self._user_summaries().items()
+                )
+                self._leaderboard_built = time.monotonic()
+            return self._leaderboard
+
+    def get_leaderboard(self, limit=None):
+        """Get sorted leaderboard of all users, or just the top `limit`"""
+        with self._lock:
+            return self._leaderboard_index().top(limit)
+
+    def get_rank(self, username):
+        """Get a user's 1-based leaderboard position (0 if unranked)"""
+        with self._lock:
+            return self._leaderboard_index().rank(username)
     
     def _calculate_accuracy(self, quiz_stats):
         total = quiz_stats.get('total_attempts', 0)
         correct = quiz_stats.get('correct_answers', 0)
-        return (correct / total * 100) if total > 0 else 0
\ No newline at end of file
+        return (correct / total * 100) if total > 0 else 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        source = sys.argv[2] if len(sys.argv) > 2 else "user_data.json"
+        target = sys.argv[3] if len(sys.argv) > 3 else "user_data.db"
+        count = migrate_json_to_sqlite(source, target)
+        print(f"Migrated {count} users from {source} to {target}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "shard":
+        source = sys.argv[2] if len(sys.argv) > 2 else "user_data.json"
+        target = sys.argv[3] if len(sys.argv) > 3 else "user_data"
+        count = migrate_json_to_shards(source, target)
+        print(f"Split {count} users from {source} into {target}/")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "convert":
+        source = sys.argv[2] if len(sys.argv) > 2 else "user_data.json"
+        target = sys.argv[3] if len(sys.argv) > 3 else "user_data.json.gz"
+        report = convert_user_data(source, target)
+        print(f"Converted {report['users']} users from {source} to {target}")
+        for label, path in (('source', source), ('target', target)):
+            stats = report[label]
+            print(f"  {path}: {stats['bytes']:,} bytes, "
+                  f"save {stats['save_ms']:.1f} ms, load {stats['load_ms']:.1f} ms")
+        size = report['target']['bytes'] / max(report['source']['bytes'], 1)
+        print(f"  size {size:.0%} of the original")
+    else:
+        print("Usage: python User_Data.py migrate [user_data.json] [user_data.db]")
+        print("       python User_Data.py shard [user_data.json] [user_data]")
+        print("       python User_Data.py convert [user_data.json] [user_data.json.gz]")
+        print("       (.min.json, .json.gz, .json.zst, .msgpack and .msgpack.zst are supported)")
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+from Activity_Log import ActivityLog, columnar_activity_log, migrate_activity_logs
+from User_Data import UserDataManager
+
+
+def test_legacy_entries_are_converted_to_columns():
+    legacy = [
+        {'date': '2025-04-04 14:55', 'action': 'Correct quiz answer', 'points': 5},
+        {'date': '2025-04-05 09:10', 'action': 'Wrong quiz answer', 'points': -10},
+        {'date': '2025-04-05 10:00', 'action': 'Correct quiz answer', 'points': 5},
+    ]
+    log = ActivityLog.for_user({'activity_log': legacy})
+    assert log.entries().to_dict('records') == legacy
+    assert log.daily()[['points', 'events', 'total']].values.tolist() == [[5, 1, 5], [-5, 2, 0]]
+
+
+def test_positional_action_codes_are_recoded():
+    old = {'actions': ['a', 'b'], 'time': [0, 60], 'action': [1, 0], 'points': [1, 2]}
+    log = ActivityLog(columnar_activity_log(old))
+    assert log.entries()['action'].tolist() == ['b', 'a']
+
+
+def test_rollups_follow_appends():
+    log = ActivityLog.for_user({'activity_log': []})
+    log.append('x', 5, datetime(2025, 1, 2, 8))
+    log.append('y', 3, datetime(2025, 1, 1, 8))
+    log.append('x', -1, datetime(2025, 1, 2, 9))
+    rebuilt = ActivityLog(log.data)
+    assert log.daily().equals(rebuilt.daily())
+    assert log.total_points() == 7
+
+
+@pytest.mark.parametrize('storage', ['json', 'wal', 'sqlite'])
+def test_sessions_interning_different_actions_keep_their_labels(tmp_path, storage):
+    path = str(tmp_path / "user_data.json")
+    first = UserDataManager(path, storage=storage)
+    first.add_user('alice', 'pw')
+    second = UserDataManager(path, storage=storage)
+
+    for manager, action, points in ((first, "Created event: Party", 10),
+                                    (second, "Searched recipe: Dal", 5)):
+        user = manager.users['alice']
+        ActivityLog.for_user(user).append(action, points)
+        manager.update_user_data('alice', user)
+
+    user = UserDataManager(path, storage=storage).users['alice']
+    entries = ActivityLog.for_user(user).entries()
+    assert sorted(zip(entries['action'], entries['points'])) == [
+        ("Created event: Party", 10), ("Searched recipe: Dal", 5)]
+
+
+def test_sessions_converting_a_legacy_log_keep_both_events(tmp_path):
+    path = str(tmp_path / "user_data.json")
+    first = UserDataManager(path, storage='json')
+    first.add_user('alice', 'pw')
+    user = first.users['alice']
+    user['activity_log'] = [{'date': '2025-04-04 14:55', 'action': 'Correct quiz answer', 'points': 5}]
+    first.update_user_data('alice', user)
+    second = UserDataManager(path, storage='json')
+
+    for manager, action in ((first, "Added leftover: Rice"), (second, "Added leftover: Dal")):
+        user = manager.users['alice']
+        ActivityLog.for_user(user).append(action, 2)
+        manager.update_user_data('alice', user)
+
+    user = UserDataManager(path, storage='json').users['alice']
+    assert ActivityLog.for_user(user).entries()['action'].tolist() == [
+        'Correct quiz answer', 'Added leftover: Rice', 'Added leftover: Dal']
+
+
+def test_migration_rewrites_legacy_entries_as_event_rows(tmp_path):
+    path = str(tmp_path / "user_data.json")
+    manager = UserDataManager(path, storage='json')
+    manager.add_user('alice', 'pw')
+    legacy = [
+        {'date': '2025-04-04 14:55', 'action': 'Correct quiz answer', 'points': 5},
+        {'date': '2025-04-05 09:10', 'action': 'Wrong quiz answer', 'points': -10},
+    ]
+    user = manager.users['alice']
+    user['activity_log'] = list(legacy)
+    manager.update_user_data('alice', user)
+    ActivityLog.for_user(user).append('Added leftover: Rice', 2, datetime(2025, 4, 6, 8))
+    manager.update_user_data('alice', user)
+
+    assert migrate_activity_logs(UserDataManager(path, storage='json')) == 2
+    stored = UserDataManager(path, storage='json').users['alice']['activity_log']
+    assert 'legacy' not in stored and len(stored['events']) == 3
+    log = ActivityLog(stored)
+    assert log.entries().to_dict('records') == legacy + [
+        {'date': '2025-04-06 08:00', 'action': 'Added leftover: Rice', 'points': 2}]
+    assert log.daily()[['points', 'events']].values.tolist() == [[5, 1], [-10, 1], [2, 1]]
+
+
+def test_stored_rollups_are_reused_until_stale():
+    log = ActivityLog.for_user({'activity_log': []})
+    log.append('x', 5, datetime(2025, 1, 1, 8))
+    data = log.data
+    assert data['daily'] == [1, [[(datetime(2025, 1, 1) - datetime(1970, 1, 1)).days, 5, 1]]]
+
+    # Another session's append merged in without its rollup
+    data['events'].append([data['events'][0][0], data['events'][0][1], 3])
+    assert ActivityLog(data).daily()[['points', 'events']].values.tolist() == [[8, 2]]
+    assert data['daily'][0] == 2
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from Gemini_Gateway import GeminiGateway
+
+
+def _gateway(**kwargs):
+    kwargs.setdefault('requests_per_minute', 60000)
+    kwargs.setdefault('backoff_base', 0.01)
+    return GeminiGateway(**kwargs)
+
+
+def _wait_for(condition, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the gateway"
+        time.sleep(0.005)
+
+
+class _FakeStream:
+    """stream_fn that records its calls and holds each stream until released"""
+
+    def __init__(self, chunks=("Hello", " world")):
+        self.chunks = chunks
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, prompt, timeout):
+        self.calls.append(prompt)
+        self.release.wait(timeout)
+        yield from self.chunks
+
+
+def test_coalesced_handles_share_one_upstream_call():
+    stream = _FakeStream()
+    gateway = _gateway()
+    first = gateway.submit(stream, "soup", timeout=5, key="soup")
+    second = gateway.submit(stream, "soup", timeout=5, key="soup")
+    assert first.id != second.id and first.job is second.job
+
+    stream.release.set()
+    assert first.result().text == second.result().text == "Hello world"
+    assert stream.calls == ["soup"]
+    assert gateway.stats()['coalesced'] == 1
+
+
+def test_cancelling_one_coalesced_handle_leaves_the_other_running():
+    stream = _FakeStream()
+    gateway = _gateway()
+    first = gateway.submit(stream, "soup", timeout=5, key="soup")
+    second = gateway.submit(stream, "soup", timeout=5, key="soup")
+
+    first.cancel()
+    assert first.result().status == "cancelled"
+    assert not second.done()
+    stream.release.set()
+    assert second.result().status == "ok"
+
+
+def test_a_hung_stream_times_out_and_frees_its_slot():
+    def hung(prompt, timeout):
+        time.sleep(timeout)  # a transport that gives up at the timeout it was given
+        raise TimeoutError("deadline exceeded")
+        yield
+
+    stream = _FakeStream()
+    stream.release.set()
+    gateway = _gateway(max_workers=1)
+    stuck = gateway.submit(hung, "hang", timeout=0.1)
+    started = time.monotonic()
+    assert stuck.result().status == "timeout"
+    assert time.monotonic() - started < 0.5
+
+    after = gateway.submit(stream, "next", timeout=3)
+    assert after.result().status == "ok"
+    _wait_for(lambda: gateway.stats()['running'] == 0)
+
+
+def test_rate_limit_retries_stop_once_text_was_emitted():
+    calls = []
+
+    def quota_after_text(prompt, timeout):
+        calls.append(prompt)
+        yield "partial"
+        raise RuntimeError("429 Resource has been exhausted")
+
+    gateway = _gateway()
+    result = gateway.submit(quota_after_text, "late", timeout=2).result()
+    assert result.status == "error" and calls == ["late"]
+
+    def quota_before_text(prompt, timeout):
+        calls.append(prompt)
+        if calls.count(prompt) == 1:
+            raise RuntimeError("429 Resource has been exhausted")
+        yield "fine"
+
+    result = gateway.submit(quota_before_text, "early", timeout=2).result()
+    assert result.text == "fine" and calls.count("early") == 2
+    assert gateway.stats()['retries'] == 1
+
+
+def test_the_fair_queue_alternates_sessions():
+    blocker = _FakeStream()
+    stream = _FakeStream(chunks=("ok",))
+    stream.release.set()
+    gateway = _gateway(max_workers=1)
+    gateway.submit(blocker, "busy", timeout=3, session="x")
+    # Held by the dispatcher until the only worker is free
+    gateway.submit(stream, "next", timeout=3, session="x")
+    _wait_for(lambda: gateway.stats()['queued'] == 0)
+
+    handles = [gateway.submit(stream, f"{session}{i}", timeout=3, session=session)
+               for session in "ab" for i in range(3)]
+    blocker.release.set()
+    for handle in handles:
+        assert handle.result().status == "ok"
+    assert stream.calls == ["next", "a0", "b0", "a1", "b1", "a2", "b2"]
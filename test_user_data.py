@@ -0,0 +1,138 @@
+import copy
+
+import pytest
+
+from User_Data import UserDataManager, WalStorage, _apply_op, _diff_record, _merge_record
+
+
+def test_merge_keeps_appends_and_increments_from_both_sides():
+    base = {'points': 10, 'log': [1], 'name': 'a'}
+    ours = {'points': 15, 'log': [1, 2], 'name': 'a'}
+    theirs = {'points': 8, 'log': [1, 3], 'name': 'a'}
+    assert _merge_record(base, ours, theirs) == {'points': 13, 'log': [1, 3, 2], 'name': 'a'}
+
+
+def test_merge_prefers_our_value_on_conflicting_fields():
+    base = {'mood': 'ok', 'friends': ['x']}
+    ours = {'mood': 'happy', 'friends': ['x']}
+    theirs = {'mood': 'sad', 'friends': ['x', 'y']}
+    assert _merge_record(base, ours, theirs) == {'mood': 'happy', 'friends': ['x', 'y']}
+
+
+def test_merge_keeps_keys_added_on_either_side():
+    base = {'stats': {}}
+    ours = {'stats': {'a': 1}}
+    theirs = {'stats': {'b': 2}, 'new': True}
+    assert _merge_record(base, ours, theirs) == {'stats': {'b': 2, 'a': 1}, 'new': True}
+
+
+def test_diff_ops_rebuild_the_new_record():
+    old = {'points': 5, 'log': [{'a': 1}], 'quiz': {'n': 1}, 'gone': 1}
+    new = {'points': 12, 'log': [{'a': 1}, {'a': 2}], 'quiz': {'n': 2, 'm': 0}, 'mood': 'x'}
+    ops = []
+    _diff_record([], old, new, ops)
+    users = {'u': copy.deepcopy(old)}
+    for op in ops:
+        _apply_op(users, {'user': 'u', **op})
+    assert users['u'] == new
+
+
+@pytest.fixture(params=['json', 'wal'])
+def managers(request, tmp_path):
+    """Two managers standing in for two sessions (or processes) on one file"""
+    path = str(tmp_path / "user_data.json")
+    first = UserDataManager(path, storage=request.param)
+    first.add_user('alice', 'pw')
+    second = UserDataManager(path, storage=request.param)
+    return path, request.param, first, second
+
+
+def _record(manager, points, recipe):
+    user = manager.users['alice']
+    user['points'] += points
+    user['created_recipes'].append({'name': recipe})
+    manager.update_user_data('alice', user)
+
+
+def test_concurrent_sessions_do_not_lose_updates(managers):
+    path, storage, first, second = managers
+    _record(first, 5, 'soup')
+    _record(second, 7, 'salad')
+    _record(first, 1, 'bread')
+
+    user = UserDataManager(path, storage=storage).users['alice']
+    assert user['points'] == 13
+    assert sorted(r['name'] for r in user['created_recipes']) == ['bread', 'salad', 'soup']
+
+
+def test_refresh_picks_up_the_other_sessions_writes(managers):
+    path, storage, first, second = managers
+    if storage == 'wal':
+        pytest.skip("the WAL backend composes deltas on disk and has no refresh")
+    _record(second, 4, 'salad')
+    first.invalidate_user('alice')
+    assert first.users['alice']['points'] == 4
+    assert [r['name'] for r in first.users['alice']['created_recipes']] == ['salad']
+
+
+def test_merge_treats_a_field_created_on_both_sides_as_empty_before():
+    base = {'log': []}
+    ours = {'log': {'rows': [[1]], 'legacy': [0]}, 'tags': ['a']}
+    theirs = {'log': {'rows': [[2]], 'legacy': [0]}, 'tags': ['b']}
+    assert _merge_record(base, ours, theirs) == {
+        'log': {'rows': [[2], [1]], 'legacy': [0]}, 'tags': ['b', 'a']}
+
+
+def test_write_behind_keeps_changes_made_during_a_flush(tmp_path):
+    path = str(tmp_path / "user_data.json")
+    manager = UserDataManager(path, storage='json', write_behind=True, flush_interval=60)
+    manager.add_user('alice', 'pw')
+    manager.flush()
+    other = UserDataManager(path, storage='json', write_behind=False)
+
+    _record(other, 100, 'salad')
+    _record(manager, 5, 'soup')
+    manager.flush()
+    # The flush merged the other session's write back into the live record
+    assert manager.users['alice']['points'] == 105
+    _record(manager, 1, 'bread')
+    manager.close()
+
+    user = UserDataManager(path, storage='json').users['alice']
+    assert user['points'] == 106
+    assert [r['name'] for r in user['created_recipes']] == ['salad', 'soup', 'bread']
+
+
+class _Crash(Exception):
+    pass
+
+
+def test_wal_compaction_interrupted_before_the_log_restarts(tmp_path, monkeypatch):
+    path = str(tmp_path / "user_data.json")
+    manager = UserDataManager(path, storage='wal')
+    manager.add_user('alice', 'pw')
+    manager.storage.compact()
+    for i in range(3):
+        user = manager.users['alice']
+        user['points'] += 5
+        user['friends'].append(str(i))
+        manager.update_user_data('alice', user)
+
+    def crash(self, ops=()):
+        raise _Crash()
+    # The new snapshot is in place but the old log is still on disk
+    monkeypatch.setattr(WalStorage, '_start_log', crash)
+    with pytest.raises(_Crash):
+        manager.storage.compact()
+    monkeypatch.undo()
+
+    user = UserDataManager(path, storage='wal').users['alice']
+    assert user['points'] == 15
+    assert user['friends'] == ['0', '1', '2']
+
+    # The next session's writes go to a fresh log and are kept
+    other = UserDataManager(path, storage='wal')
+    _record(other, 1, 'soup')
+    user = UserDataManager(path, storage='wal').users['alice']
+    assert user['points'] == 16
+    assert user['friends'] == ['0', '1', '2']